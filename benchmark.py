@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量下载性能基准测试
+在本地启动模拟的 Etherscan V2 getsourcecode 接口，按不同批量大小和并发数运行
+download_contracts_batch，输出吞吐量、延迟分位数、峰值内存和写入字节数 (JSON)
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PAYLOAD_SHAPES = ["single", "standard-json", "huge"]
+
+
+def build_payload(shape: str, file_size: int = 4096, file_count: int = 8) -> bytes:
+    """生成 getsourcecode 的响应体
+
+    single: 单个 .sol 文件；standard-json: {{...}} 包裹的标准 JSON 输入；
+    huge: 文件数放大 25 倍、文件大小放大 5 倍的标准 JSON 输入 (约 4 MB)。
+    """
+    def source(name: str, size: int) -> str:
+        line = f"    function {name.replace('/', '_').replace('.', '_')}() public pure returns (uint256) {{ return 1; }}\n"
+        body = line * max(1, size // len(line))
+        return f"// SPDX-License-Identifier: MIT\npragma solidity ^0.8.20;\n\ncontract {Path(name).stem} {{\n{body}}}\n"
+
+    result = {
+        "ContractName": "Bench",
+        "CompilerVersion": "v0.8.20+commit.a1b79de6",
+        "OptimizationUsed": "1",
+        "Runs": "200",
+        "ConstructorArguments": "",
+        "Library": "",
+        "LicenseType": "MIT",
+        "Proxy": "0",
+        "Implementation": "",
+        "SwarmSource": ""
+    }
+
+    if shape == "single":
+        result["SourceCode"] = source("Bench.sol", file_size)
+    elif shape in ("standard-json", "huge"):
+        if shape == "huge":
+            file_size, file_count = file_size * 5, file_count * 25
+        sources = {
+            f"contracts/lib{i // 10}/Module{i}.sol": {"content": source(f"Module{i}.sol", file_size)}
+            for i in range(file_count)
+        }
+        standard_json = {
+            "language": "Solidity",
+            "sources": sources,
+            "settings": {"optimizer": {"enabled": True, "runs": 200}, "outputSelection": {"*": {"*": ["abi"]}}}
+        }
+        result["SourceCode"] = "{" + json.dumps(standard_json) + "}"
+    else:
+        raise ValueError(f"未知的响应类型 '{shape}'，支持: {', '.join(PAYLOAD_SHAPES)}")
+
+    return json.dumps({"status": "1", "message": "OK", "result": [result]}).encode("utf-8")
+
+
+class MockEtherscanServer:
+    """模拟的 Etherscan V2 API (/v2/api?module=contract&action=getsourcecode)
+
+    latency 为每个请求的平均延迟 (秒)，jitter 为延迟的相对抖动；
+    error_rate 比例的请求返回 503，rate_limit_rate 比例的请求返回速率限制回复。
+    """
+
+    def __init__(self, shape: str = "single", latency: float = 0.05, jitter: float = 0.2, error_rate: float = 0.0, rate_limit_rate: float = 0.0, seed: int = 0):
+        self.payload = build_payload(shape)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}/v2/api"
+
+    def _handler(self):
+        mock = self
+        rate_limit_body = json.dumps({"status": "0", "message": "NOTOK", "result": "Max calls per sec rate limit reached (5/sec)"}).encode("utf-8")
+        error_body = b"<html><body>503 Service Temporarily Unavailable</body></html>"
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和响应体分开写出，保持连接时 Nagle 算法加上延迟确认会给每个请求增加约 40 ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                with mock.lock:
+                    mock.requests += 1
+                    roll = mock.random.random()
+                    delay = mock.latency * mock.random.uniform(1 - mock.jitter, 1 + mock.jitter)
+                if delay > 0:
+                    time.sleep(delay)
+
+                status, body, content_type = 200, mock.payload, "application/json"
+                if query.get("action", [""])[0] != "getsourcecode":
+                    body = json.dumps({"status": "0", "message": "NOTOK", "result": "Error! Invalid action"}).encode("utf-8")
+                elif roll < mock.error_rate:
+                    with mock.lock:
+                        mock.errors += 1
+                    status, body, content_type = 503, error_body, "text/html"
+                elif roll < mock.error_rate + mock.rate_limit_rate:
+                    with mock.lock:
+                        mock.rate_limited += 1
+                    body = rate_limit_body
+
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self) -> "MockEtherscanServer":
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"requests": self.requests, "errors_injected": self.errors, "rate_limits_injected": self.rate_limited}
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩法计算分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def directory_size(path: Path) -> Dict[str, int]:
+    """统计目录中写入的字节数和文件数 (硬链接只计一次)"""
+    seen = set()
+    total_bytes = 0
+    files = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            stat = os.lstat(os.path.join(root, name))
+            if (stat.st_dev, stat.st_ino) in seen:
+                continue
+            seen.add((stat.st_dev, stat.st_ino))
+            total_bytes += stat.st_size
+            files += 1
+    return {"bytes_written": total_bytes, "files_written": files}
+
+
+def peak_rss_kb() -> Optional[int]:
+    """本进程及已结束子进程 (解析进程池) 的峰值内存 (KB)"""
+    if resource is None:
+        return None
+    scale = 1024 if sys.platform == "darwin" else 1  # macOS 返回字节
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale
+    return max(own, children)
+
+
+def run_worker(config: Dict) -> Dict:
+    """在独立进程中运行一次批量下载，保证峰值内存互不影响"""
+    output_dir = Path(config["output_dir"])
+    os.environ["OUTPUT_DIR"] = str(output_dir)
+    # 只有 V2 模式使用 api_url (指向模拟服务器)；强制设置，避免 .env 中的 USE_ETHERSCAN_V2=false 把请求发往真实的 V1 浏览器
+    os.environ["USE_ETHERSCAN_V2"] = "true"
+    os.environ.setdefault("ETHERSCAN_API_KEY", "benchmark")
+    # 基准测试默认不限速、不使用缓存，重试退避缩短到毫秒级 (可通过环境变量覆盖)
+    os.environ.setdefault("RATE_LIMIT", "0")
+    os.environ.setdefault("CACHE_ENABLED", "false")
+    os.environ.setdefault("RETRY_BACKOFF_BASE", "0.05")
+    os.environ.setdefault("RETRY_BACKOFF_MAX", "1")
+
+    from contract_downloader import ContractDownloader
+
+    started: Dict[str, float] = {}
+    latencies: List[float] = []
+    latencies_lock = threading.Lock()
+
+    class BenchmarkDownloader(ContractDownloader):
+        """记录每个合约从首次请求到写入完成的耗时"""
+
+        def _fetch_batch_entry(self, i, total_contracts, contract):
+            with latencies_lock:
+                started.setdefault(f"{contract['name']}_{contract['address']}", time.perf_counter())
+            task = super()._fetch_batch_entry(i, total_contracts, contract)
+            if task["contract_data"] is None:
+                self._record_latency(task["key"])
+            return task
+
+        def _persist_batch_entry(self, task, parsed=None):
+            outcome = super()._persist_batch_entry(task, parsed)
+            self._record_latency(task["key"])
+            return outcome
+
+        def _record_latency(self, key):
+            with latencies_lock:
+                if key in started:
+                    latencies.append(time.perf_counter() - started.pop(key))
+
+    contracts = [
+        {"name": f"Bench_{i}", "chain": "eth", "address": f"0x{i:040x}"}
+        for i in range(1, config["batch_size"] + 1)
+    ]
+
+    downloader = BenchmarkDownloader()
+    downloader.api_url = config["api_url"]
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        results = downloader.download_contracts_batch(contracts, concurrency=config["concurrency"])
+        elapsed = time.perf_counter() - start
+
+    http_stats = downloader.http.connection_stats()
+    downloader.close()
+
+    succeeded = sum(1 for success in results.values() if success)
+    report = {
+        "elapsed_sec": round(elapsed, 4),
+        "contracts": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "contracts_per_sec": round(succeeded / elapsed, 2) if elapsed > 0 else None,
+        "latency_p50_ms": None,
+        "latency_p99_ms": None,
+        "peak_rss_kb": peak_rss_kb(),
+        "http_requests": http_stats["requests"]
+    }
+    if latencies:
+        report["latency_p50_ms"] = round(percentile(latencies, 50) * 1000, 2)
+        report["latency_p99_ms"] = round(percentile(latencies, 99) * 1000, 2)
+    report.update(directory_size(output_dir))
+    return report
+
+
+def run_scenario(shape: str, batch_size: int, concurrency: int, args) -> Dict:
+    """启动模拟服务器并在子进程中运行一个场景"""
+    server = MockEtherscanServer(shape, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed).start()
+    output_dir = Path(tempfile.mkdtemp(prefix="contract_bench_"))
+    config = {"api_url": server.url, "output_dir": str(output_dir), "batch_size": batch_size, "concurrency": concurrency}
+
+    try:
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(config)],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"基准测试进程失败:\n{process.stderr.strip()}")
+        report = json.loads(process.stdout.strip().splitlines()[-1])
+    finally:
+        server.stop()
+        if not args.keep_output:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    scenario = {"shape": shape, "batch_size": batch_size, "concurrency": concurrency}
+    if args.keep_output:
+        scenario["output_dir"] = str(output_dir)
+    return {**scenario, **report, "server": server.stats()}
+
+
+def environment_info() -> Dict:
+    """记录运行环境，便于跨版本对比"""
+    info = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": None
+    }
+    try:
+        info["git_commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def compare_results(current: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """与基准结果对比，返回吞吐量下降超过 max_regression 的场景"""
+    def key(result):
+        return (result["shape"], result["batch_size"], result["concurrency"])
+
+    baseline_results = {key(result): result for result in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        previous = baseline_results.get(key(result))
+        if not previous or not previous.get("contracts_per_sec") or result.get("contracts_per_sec") is None:
+            continue
+        change = result["contracts_per_sec"] / previous["contracts_per_sec"] - 1
+        line = f"{result['shape']} batch={result['batch_size']} c={result['concurrency']}: {previous['contracts_per_sec']} -> {result['contracts_per_sec']} 个/秒 ({change:+.1%})"
+        print(line, file=sys.stderr)
+        if change < -max_regression:
+            regressions.append(line)
+    return regressions
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="批量下载性能基准测试 (本地模拟 Etherscan API)")
+    parser.add_argument("--batch-sizes", type=parse_int_list, default=[50, 200], help="批量大小列表，逗号分隔 (默认: 50,200)")
+    parser.add_argument("--concurrency", type=parse_int_list, default=[1, 4, 16], help="并发数列表，逗号分隔 (默认: 1,4,16)")
+    parser.add_argument("--shapes", default="single,standard-json", help=f"响应类型列表，逗号分隔，可选: {', '.join(PAYLOAD_SHAPES)} (默认: single,standard-json)")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟 API 的平均延迟秒数 (默认: 0.05)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟的相对抖动 (默认: 0.2)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的请求比例 (默认: 0)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回速率限制回复的请求比例 (默认: 0)")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子 (默认: 0)")
+    parser.add_argument("--output", "-o", help="结果 JSON 文件 (默认输出到标准输出)")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 对比吞吐量")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="对比时允许的吞吐量下降比例，超出则返回非零退出码 (默认: 0.1)")
+    parser.add_argument("--keep-output", action="store_true", help="保留每个场景的输出目录")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(json.loads(args.worker))))
+        return
+
+    shapes = [shape.strip() for shape in args.shapes.split(",") if shape.strip()]
+    for shape in shapes:
+        if shape not in PAYLOAD_SHAPES:
+            parser.error(f"未知的响应类型 '{shape}'，支持: {', '.join(PAYLOAD_SHAPES)}")
+
+    report = {
+        "environment": environment_info(),
+        "settings": {
+            "latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+            "rate_limit_rate": args.rate_limit_rate, "seed": args.seed
+        },
+        "results": []
+    }
+
+    for shape in shapes:
+        for batch_size in args.batch_sizes:
+            for concurrency in args.concurrency:
+                print(f"运行: {shape} batch={batch_size} concurrency={concurrency} ...", file=sys.stderr)
+                result = run_scenario(shape, batch_size, concurrency, args)
+                print(f"  {result['contracts_per_sec']} 个/秒, p50 {result['latency_p50_ms']} ms, p99 {result['latency_p99_ms']} ms, 峰值内存 {result['peak_rss_kb']} KB", file=sys.stderr)
+                report["results"].append(result)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"结果已保存到: {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.max_regression)
+        if regressions:
+            print(f"\n❌ {len(regressions)} 个场景吞吐量下降超过 {args.max_regression:.0%}:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
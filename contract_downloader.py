@@ -7,14 +7,35 @@
 """
 
 import os
+import re
 import sys
 import json
 import csv
 import time
+import calendar
+import zlib
+import gzip
+import sqlite3
+import hashlib
+import heapq
+import random
+import shutil
+import socket
+import threading
+import multiprocessing
+import cProfile
+import pstats
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
 from pathlib import Path
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple, Iterable, Iterator, Callable
 import argparse
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
 
 # 尝试加载 dotenv
 try:
@@ -24,10 +45,2139 @@ except ImportError:
     print("提示: 安装 python-dotenv 以使用 .env 文件管理 API 密钥")
     print("运行: pip install python-dotenv")
 
+# 链名称映射到ID
+CHAIN_NAME_TO_ID = {
+    'eth': '1',
+    'ethereum': '1',
+    'bsc': '56',
+    'bnb': '56',
+    'polygon': '137',
+    'matic': '137',
+    'fantom': '250',
+    'ftm': '250',
+    'avalanche': '43114',
+    'avax': '43114',
+    'arbitrum': '42161',
+    'arb': '42161',
+    'optimism': '10',
+    'opt': '10'
+}
+
+
+class RetryLaterError(Exception):
+    """请求暂时无法完成，应在 retry_after 秒后重试 (批量下载中重新排队)"""
+    
+    def __init__(self, message: str = "", retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitError(RetryLaterError):
+    """API 返回速率限制错误 (Max rate limit reached)"""
+
+
+class CircuitOpenError(RetryLaterError):
+    """链的熔断器处于打开状态，暂停对该链的请求"""
+
+
+class CircuitBreaker:
+    """单条链的熔断器
+    
+    连续 failure_threshold 次可重试错误后打开，reset_timeout 秒内拒绝对该链的请求；
+    之后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+    
+    def check(self, chain_name: str = "") -> bool:
+        """允许请求则返回，否则抛出 CircuitOpenError
+        
+        Returns:
+            bool: 本次请求是否为半开状态的探测请求 (调用方须以 record_success、record_failure 或 release_probe 结束探测)
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(f"{chain_name} 熔断中，{remaining:.1f} 秒后重试", retry_after=remaining)
+            if self.probe_in_flight:
+                raise CircuitOpenError(f"{chain_name} 熔断探测中", retry_after=1.0)
+            self.probe_in_flight = True
+            return True
+    
+    def release_probe(self):
+        """探测请求未得到结果就结束时 (如没有可用的 API 密钥) 释放探测名额，不计入成功或失败"""
+        with self.lock:
+            self.probe_in_flight = False
+    
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_in_flight = False
+    
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probe_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probe_in_flight = False
+
+
+class TokenBucketRateLimiter:
+    """令牌桶限速器
+    
+    按 rate (每秒请求数) 匀速发放令牌，最多累积 burst 个。
+    遇到速率限制回复时速率减半并暂停一段时间，之后每次成功请求逐步恢复到配置速率。
+    rate <= 0 表示不限速。
+    """
+    
+    def __init__(self, rate: float, burst: int = 1, backoff: float = 1.0, max_backoff: float = 60.0):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = rate / 16 if rate > 0 else 0
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.base_backoff = backoff
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+    
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+    
+    def try_acquire(self) -> float:
+        """尝试立即获取一个令牌，成功返回 0，否则返回还需等待的秒数"""
+        if self.max_rate <= 0:
+            return 0.0
+        
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+    
+    def acquire(self) -> float:
+        """获取一个令牌，必要时阻塞等待，返回等待的秒数"""
+        waited = 0.0
+        while True:
+            wait_time = self.try_acquire()
+            if wait_time <= 0:
+                return waited
+            time.sleep(wait_time)
+            waited += wait_time
+    
+    def on_rate_limited(self):
+        """收到速率限制回复: 速率减半，清空令牌并暂停 backoff 秒"""
+        if self.max_rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.paused_until = max(self.paused_until, now + self.backoff)
+            self.updated = self.paused_until
+            self.backoff = min(self.max_backoff, self.backoff * 2)
+    
+    def on_success(self):
+        """请求未被限速: 逐步恢复速率"""
+        if self.max_rate <= 0:
+            return
+        with self.lock:
+            self.backoff = self.base_backoff
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class ApiKeyPool:
+    """API 密钥池
+    
+    每个密钥有独立的令牌桶，请求被调度到最先有可用令牌的密钥上，
+    因此总吞吐量随密钥数量近似线性增长。触发每日配额的密钥会被暂停 cooldown 秒。
+    没有配置密钥时使用一个无密钥的令牌桶。
+    """
+    
+    def __init__(self, keys: List[str], rate: float, burst: int = 1, cooldown: float = 3600):
+        self.keys: List[Optional[str]] = list(keys) or [None]
+        self.limiters = {key: TokenBucketRateLimiter(rate, burst) for key in self.keys}
+        self.cooldown = cooldown
+        self.benched_until: Dict[Optional[str], float] = {}
+        self.next_index = 0
+        self.lock = threading.Lock()
+    
+    def _active_keys(self) -> List[Optional[str]]:
+        now = time.monotonic()
+        with self.lock:
+            # 轮转起点，让空闲时的请求均匀分布到各个密钥
+            start = self.next_index
+            self.next_index = (self.next_index + 1) % len(self.keys)
+            ordered = self.keys[start:] + self.keys[:start]
+            return [key for key in ordered if self.benched_until.get(key, 0) <= now]
+    
+    def acquire(self) -> Optional[str]:
+        """取得一个可用密钥及其令牌，必要时阻塞等待；所有密钥都被暂停时抛出 RateLimitError"""
+        while True:
+            active_keys = self._active_keys()
+            if not active_keys:
+                raise RateLimitError("所有 API 密钥均已达到每日配额")
+            
+            shortest_wait = None
+            for key in active_keys:
+                wait_time = self.limiters[key].try_acquire()
+                if wait_time <= 0:
+                    return key
+                if shortest_wait is None or wait_time < shortest_wait:
+                    shortest_wait = wait_time
+            time.sleep(shortest_wait)
+    
+    def on_rate_limited(self, key: Optional[str], daily: bool = False):
+        """密钥触发速率限制: 每秒限制则该密钥降速退避，每日配额则暂停该密钥"""
+        if daily and len(self.keys) > 1:
+            with self.lock:
+                self.benched_until[key] = time.monotonic() + self.cooldown
+        else:
+            self.limiters[key].on_rate_limited()
+    
+    def on_success(self, key: Optional[str]):
+        self.limiters[key].on_success()
+    
+    def active_count(self) -> int:
+        now = time.monotonic()
+        with self.lock:
+            return sum(1 for key in self.keys if self.benched_until.get(key, 0) <= now)
+
+
+class SingleFlight:
+    """合并相同键的并发调用
+    
+    同一时刻每个键只有一个线程执行 fn，其余线程等待并共享它的结果 (或异常)。
+    """
+    
+    def __init__(self):
+        self.calls: Dict[object, Dict] = {}
+        self.lock = threading.Lock()
+    
+    def do(self, key, fn) -> Tuple[object, bool]:
+        """执行或等待 fn()，返回 (结果, 是否共享了其他线程的结果)"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self.calls[key] = call
+        
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"], True
+        
+        try:
+            call["result"] = fn()
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call["done"].set()
+        return call["result"], False
+
+
+class LRUCache:
+    """线程安全的内存 LRU 缓存，超过 max_entries 时淘汰最久未使用的条目，条目超过 ttl 秒失效 (0 表示不过期)"""
+    
+    def __init__(self, max_entries: int = 1024, ttl: float = 0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.entries: "OrderedDict[object, Tuple[float, object]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        """返回缓存的值，不存在或已过期时返回 None"""
+        with self.lock:
+            item = self.entries.get(key)
+            if item is not None and self.ttl > 0 and time.monotonic() - item[0] > self.ttl:
+                del self.entries[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+    
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+    
+    def stats(self) -> Dict:
+        with self.lock:
+            return {"entries": len(self.entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+class FairScheduler:
+    """批量条目的多链公平调度器
+    
+    从输入中预读最多 lookahead 个条目，按链放入各自的队列 (队列内按 priority 从高到低，其次按输入顺序)。
+    每次调度时依次比较: 链当前可用 (未熔断) 优先、队首优先级高的优先、在途请求数 / 权重少的优先、
+    已调度数 / 权重少的优先。慢链或受限速的链最多占用与其权重相称的并发数，不会拖住其他链。
+    policy 为 round-robin 时所有链权重相同，为 weighted 时使用 weights ({链ID: 权重})。
+    """
+    
+    POLICIES = ("fifo", "round-robin", "weighted")
+    
+    def __init__(self, source: Iterator[Tuple[int, Dict]], chain_of: Callable[[Dict], str], lookahead: int = 10000,
+                 policy: str = "round-robin", weights: Optional[Dict[str, float]] = None):
+        self.source = source
+        self.chain_of = chain_of
+        self.lookahead = max(1, lookahead)
+        self.weights = weights if policy == "weighted" and weights else {}
+        self.queues: Dict[str, List[Tuple[float, int, Dict]]] = {}
+        self.in_flight: Dict[str, int] = {}
+        self.dispatched: Dict[str, float] = {}
+        self.last_dispatch: Dict[str, int] = {}
+        self.sequence = 0
+        self.buffered = 0
+        self.exhausted = False
+    
+    @staticmethod
+    def priority(contract: Dict) -> float:
+        try:
+            return float(contract.get("priority") or 0)
+        except (TypeError, ValueError):
+            return 0.0
+    
+    def weight(self, chain: str) -> float:
+        return max(self.weights.get(chain, 1.0), 1e-6)
+    
+    def _fill(self):
+        while not self.exhausted and self.buffered < self.lookahead:
+            item = next(self.source, None)
+            if item is None:
+                self.exhausted = True
+                break
+            index, contract = item
+            chain = self.chain_of(contract)
+            queue = self.queues.setdefault(chain, [])
+            if not queue:
+                # 重新有条目的链从当前进度开始计数，不因之前空闲而连续占用调度
+                active = [self.dispatched.get(other, 0) / self.weight(other) for other, other_queue in self.queues.items() if other_queue]
+                if active:
+                    self.dispatched[chain] = max(self.dispatched.get(chain, 0), min(active) * self.weight(chain))
+            heapq.heappush(queue, (-self.priority(contract), index, contract))
+            self.buffered += 1
+    
+    def next(self, available: Optional[Callable[[str], bool]] = None) -> Optional[Tuple[int, Dict]]:
+        """选出下一个要请求的条目，输入和队列都为空时返回 None"""
+        self._fill()
+        candidates = [chain for chain, queue in self.queues.items() if queue]
+        if not candidates:
+            return None
+        
+        def rank(chain: str):
+            weight = self.weight(chain)
+            return (
+                available is not None and not available(chain),
+                self.queues[chain][0][0],
+                self.in_flight.get(chain, 0) / weight,
+                self.dispatched.get(chain, 0) / weight,
+                self.last_dispatch.get(chain, -1)
+            )
+        
+        chain = min(candidates, key=rank)
+        _, index, contract = heapq.heappop(self.queues[chain])
+        self.buffered -= 1
+        self.dispatched[chain] = self.dispatched.get(chain, 0) + 1
+        self.sequence += 1
+        self.last_dispatch[chain] = self.sequence
+        return index, contract
+    
+    def started(self, contract: Dict):
+        chain = self.chain_of(contract)
+        self.in_flight[chain] = self.in_flight.get(chain, 0) + 1
+    
+    def finished(self, contract: Dict):
+        chain = self.chain_of(contract)
+        self.in_flight[chain] = max(0, self.in_flight.get(chain, 0) - 1)
+
+
+class Metrics:
+    """运行指标: 计数器和直方图 (线程安全)
+    
+    指标名和标签与 Prometheus 一致，直方图使用固定的秒级桶边界。
+    可导出为 JSON 报告，或按间隔写入 Prometheus 文本格式文件 (node_exporter textfile 收集器)。
+    """
+    
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    
+    def __init__(self, prefix: str = "contract_downloader"):
+        self.prefix = prefix
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.histograms: Dict[Tuple[str, Tuple], Dict] = {}
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        self._exporter = None
+        self._exporter_stop = threading.Event()
+    
+    @staticmethod
+    def _key(name: str, labels: Dict) -> Tuple[str, Tuple]:
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        """计数器加 value"""
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name: str, value: float, **labels):
+        """向直方图记录一次观测值 (秒)"""
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = {"count": 0, "sum": 0.0, "min": value, "max": value, "buckets": [0] * len(self.BUCKETS)}
+                self.histograms[key] = histogram
+            histogram["count"] += 1
+            histogram["sum"] += value
+            histogram["min"] = min(histogram["min"], value)
+            histogram["max"] = max(histogram["max"], value)
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+                    break
+    
+    def counter_total(self, name: str) -> float:
+        """合并所有标签后的计数器值"""
+        with self.lock:
+            return sum(value for (counter, _), value in self.counters.items() if counter == name)
+    
+    def _summarize(self, histogram: Dict) -> Dict:
+        summary = {
+            "count": histogram["count"],
+            "sum": round(histogram["sum"], 6),
+            "avg": round(histogram["sum"] / histogram["count"], 6),
+            "min": round(histogram["min"], 6),
+            "max": round(histogram["max"], 6)
+        }
+        # 分位数按桶估算 (取所在桶的上界，不超过最大值)
+        for quantile in (50, 90, 99):
+            target = histogram["count"] * quantile / 100
+            cumulative = 0
+            value = histogram["max"]
+            for bound, count in zip(self.BUCKETS, histogram["buckets"]):
+                cumulative += count
+                if cumulative >= target:
+                    value = min(bound, histogram["max"])
+                    break
+            summary[f"p{quantile}"] = round(value, 6)
+        return summary
+    
+    def histogram_summary(self, name: str) -> Optional[Dict]:
+        """合并所有标签后的直方图摘要 (次数、总和、平均值、分位数)"""
+        with self.lock:
+            matching = [histogram for (histogram_name, _), histogram in self.histograms.items() if histogram_name == name]
+            if not matching:
+                return None
+            merged = {
+                "count": sum(h["count"] for h in matching),
+                "sum": sum(h["sum"] for h in matching),
+                "min": min(h["min"] for h in matching),
+                "max": max(h["max"] for h in matching),
+                "buckets": [sum(counts) for counts in zip(*(h["buckets"] for h in matching))]
+            }
+            return self._summarize(merged)
+    
+    def report(self) -> Dict:
+        """JSON 报告"""
+        with self.lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            histograms = [
+                {"name": name, "labels": dict(labels), **self._summarize(histogram)}
+                for (name, labels), histogram in sorted(self.histograms.items())
+            ]
+        return {
+            "started_at": self.started_at,
+            "elapsed_sec": round(time.time() - self.started_at, 3),
+            "counters": counters,
+            "histograms": histograms
+        }
+    
+    def to_prometheus(self) -> str:
+        """Prometheus 文本格式"""
+        def format_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+            return "{" + ",".join(f'{label}="{value}"' for (label, _), value in zip(pairs, escaped)) + "}"
+        
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                metric = f"{self.prefix}_{name}"
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} counter")
+                    typed.add(metric)
+                lines.append(f"{metric}{format_labels(labels)} {value:g}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                metric = f"{self.prefix}_{name}"
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} histogram")
+                    typed.add(metric)
+                cumulative = 0
+                for bound, count in zip(self.BUCKETS, histogram["buckets"]):
+                    cumulative += count
+                    lines.append(f"{metric}_bucket{format_labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+                lines.append(f"{metric}_bucket{format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{metric}_sum{format_labels(labels)} {histogram['sum']:g}")
+                lines.append(f"{metric}_count{format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+    
+    @staticmethod
+    def _write_atomic(path: Path, content: str):
+        path = Path(path)
+        if path.parent:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    
+    def write_json(self, path):
+        self._write_atomic(path, json.dumps(self.report(), indent=2, ensure_ascii=False) + "\n")
+    
+    def write_prometheus(self, path):
+        self._write_atomic(path, self.to_prometheus())
+    
+    def start_exporter(self, path, interval: float = 15):
+        """后台线程每 interval 秒写入一次 Prometheus 文本文件"""
+        self.stop_exporter()
+        self._exporter_stop.clear()
+        
+        def export():
+            while not self._exporter_stop.wait(interval):
+                try:
+                    self.write_prometheus(path)
+                except OSError as e:
+                    print(f"警告: 写入指标文件失败: {e}")
+        
+        self._exporter = threading.Thread(target=export, name="metrics-exporter", daemon=True)
+        self._exporter.start()
+    
+    def stop_exporter(self):
+        if self._exporter is not None:
+            self._exporter_stop.set()
+            self._exporter.join()
+            self._exporter = None
+
+
+class RunProfiler:
+    """cProfile 性能剖析 (--profile)
+    
+    Python 3.12+ 的 cProfile 基于 sys.monitoring，一个分析器即可覆盖所有线程；
+    更早的版本中每个工作线程启动时各自创建分析器，导出时合并。
+    """
+    
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.thread_profiles: List[cProfile.Profile] = []
+        self.lock = threading.Lock()
+    
+    def start(self):
+        self.profile.enable()
+    
+    def thread_initializer(self):
+        """作为线程池的 initializer，在工作线程中启动分析器"""
+        if sys.version_info >= (3, 12):
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        with self.lock:
+            self.thread_profiles.append(profile)
+    
+    def dump(self, path):
+        """停止分析并保存 (可用 python -m pstats <文件> 查看)"""
+        self.profile.disable()
+        stats = pstats.Stats(self.profile)
+        with self.lock:
+            for profile in self.thread_profiles:
+                stats.add(profile)
+            self.thread_profiles = []
+        stats.dump_stats(str(path))
+
+
+# 当前线程中建立连接 (DNS 解析、TCP 握手、TLS 握手) 的累计耗时
+_connect_timing = threading.local()
+
+
+class _TimedConnectionMixin:
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connect_timing.seconds = getattr(_connect_timing, "seconds", 0.0) + time.perf_counter() - start
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """记录建立连接耗时的 HTTPAdapter"""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+
+class HttpClient:
+    """共享的 HTTP 客户端
+    
+    单个会话内复用 keep-alive 连接池，单个合约和批量下载共用。
+    HTTP2=true 且安装了 httpx[http2] 时使用 HTTP/2，否则使用 requests (HTTP/1.1)。
+    httpx 的异常统一转换为 requests 异常，调用方无需区分后端。
+    提供 metrics 时记录建立连接、首字节 (TTFB) 和读取响应体的耗时。
+    """
+    
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 10, read_timeout: float = 30, http2: bool = False, metrics: Optional[Metrics] = None):
+        self.metrics = metrics
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.http2 = False
+        self.request_count = 0
+        self.lock = threading.Lock()
+        
+        if http2:
+            try:
+                import httpx
+                import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+                self._httpx = httpx
+                self.client = httpx.Client(
+                    http2=True,
+                    timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                    limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+                )
+                self.http2 = True
+            except ImportError:
+                print("提示: 安装 httpx[http2] 以启用 HTTP/2，当前使用 HTTP/1.1")
+                print("运行: pip install 'httpx[http2]'")
+        
+        if not self.http2:
+            self.session = requests.Session()
+            self._mount_adapter(pool_size)
+    
+    def _mount_adapter(self, pool_size: int):
+        adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.pool_size = pool_size
+    
+    def ensure_pool_size(self, pool_size: int):
+        """确保连接池不小于并发数，避免多余连接被丢弃而无法复用"""
+        if not self.http2 and pool_size > self.pool_size:
+            self._mount_adapter(pool_size)
+    
+    def get(self, url: str, params: Optional[Dict] = None):
+        """发送 GET 请求，返回响应对象 (支持 raise_for_status() 和 json())"""
+        with self.lock:
+            self.request_count += 1
+        
+        if not self.http2:
+            # stream=True: 收到响应头时返回，分别统计首字节和响应体耗时
+            _connect_timing.seconds = 0.0
+            start = time.perf_counter()
+            response = self.session.get(url, params=params, timeout=self.timeout, stream=True)
+            headers_at = time.perf_counter()
+            body_size = len(response.content)
+            self._record_timing(start, headers_at, body_size, _connect_timing.seconds)
+            return response
+        
+        httpx = self._httpx
+        try:
+            start = time.perf_counter()
+            response = self.client.send(self.client.build_request("GET", url, params=params), stream=True)
+            headers_at = time.perf_counter()
+            try:
+                body_size = len(response.read())
+            finally:
+                response.close()
+            self._record_timing(start, headers_at, body_size)
+            response.raise_for_status()
+            return response
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except httpx.HTTPStatusError as e:
+            error = requests.exceptions.HTTPError(str(e))
+            error.status_code = e.response.status_code
+            raise error from e
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+    
+    def _record_timing(self, start: float, headers_at: float, body_size: int, connect: Optional[float] = None):
+        """记录一次请求的耗时 (HTTP/2 下无法单独统计建立连接的耗时)"""
+        if self.metrics is None:
+            return
+        connect = connect or 0.0
+        if connect > 0:
+            self.metrics.observe("http_connect_seconds", connect)
+        self.metrics.observe("http_ttfb_seconds", max(0.0, headers_at - start - connect))
+        self.metrics.observe("http_body_seconds", time.perf_counter() - headers_at)
+        self.metrics.inc("http_response_bytes_total", body_size)
+    
+    def connection_stats(self) -> Dict[str, Optional[int]]:
+        """返回请求数、新建连接数和复用连接数 (HTTP/2 下连接数不可统计，为 None)"""
+        if self.http2:
+            return {"requests": self.request_count, "new_connections": None, "reused_connections": None}
+        
+        new_connections = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    new_connections += pool.num_connections
+        return {
+            "requests": self.request_count,
+            "new_connections": new_connections,
+            "reused_connections": max(0, self.request_count - new_connections)
+        }
+    
+    def close(self):
+        if self.http2:
+            self.client.close()
+        else:
+            self.session.close()
+
+
+class ResponseCache:
+    """getsourcecode 响应的持久化缓存 (SQLite 单文件)
+    
+    键为 (chainid, 小写地址, 区块 tag)，按访问时间做 LRU 淘汰，
+    总大小不超过 max_bytes；ttl > 0 时超过 ttl 秒的条目视为过期。
+    getsourcecode 的结果与区块 tag 无关，读取时优先使用相同 tag 的条目，否则使用同一地址的任意条目。
+    
+    未验证、源代码为空等确定没有源代码的结果记录在负缓存 (negative 表) 中，
+    附带原因代码，negative_ttl 秒后过期重新检查；negative_ttl <= 0 时不记录。
+    """
+    
+    # 负缓存原因代码
+    NEGATIVE_REASONS = {
+        "not_verified": "合约未验证",
+        "empty_source": "源代码为空 (未验证合约或外部账户)",
+        "not_found": "未找到合约源代码"
+    }
+    
+    def __init__(self, cache_dir: Path, max_bytes: int = 1024 * 1024 * 1024, ttl: float = 0, negative_ttl: float = 86400):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.lock = threading.Lock()
+        
+        self.conn = sqlite3.connect(str(self.cache_dir / "responses.sqlite"), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "chain_id TEXT NOT NULL, address TEXT NOT NULL, tag TEXT NOT NULL, "
+            "data TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL, "
+            "PRIMARY KEY (chain_id, address, tag))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS negative ("
+            "chain_id TEXT NOT NULL, address TEXT NOT NULL, tag TEXT NOT NULL, "
+            "reason TEXT NOT NULL, message TEXT, created_at REAL NOT NULL, expires_at REAL NOT NULL, "
+            "PRIMARY KEY (chain_id, address, tag))"
+        )
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    
+    @staticmethod
+    def make_key(chain_id: str, address: str, tag: Optional[str] = None) -> Tuple[str, str, str]:
+        return str(chain_id), address.lower(), str(tag or "")
+    
+    def get(self, chain_id: str, address: str, tag: Optional[str] = None) -> Optional[Dict]:
+        """读取缓存，未命中或已过期返回 None"""
+        key = self.make_key(chain_id, address, tag)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT rowid, data, size, created_at FROM responses WHERE chain_id = ? AND address = ? "
+                "ORDER BY tag = ? DESC, created_at DESC LIMIT 1", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            
+            rowid, data, size, created_at = row
+            if self.ttl > 0 and now - created_at > self.ttl:
+                self.conn.execute("DELETE FROM responses WHERE rowid = ?", (rowid,))
+                self.total_bytes -= size
+                self.misses += 1
+                return None
+            
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE rowid = ?", (now, rowid))
+            self.hits += 1
+        return json.loads(data)
+    
+    def put(self, chain_id: str, address: str, tag: Optional[str], contract_data: Dict):
+        """写入缓存，超出大小上限时淘汰最久未访问的条目"""
+        key = self.make_key(chain_id, address, tag)
+        data = json.dumps(contract_data, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute(
+                "SELECT size FROM responses WHERE chain_id = ? AND address = ? AND tag = ?", key
+            ).fetchone()
+            if old:
+                self.total_bytes -= old[0]
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (chain_id, address, tag, data, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", key + (data, size, now, now)
+            )
+            self.conn.execute("DELETE FROM negative WHERE chain_id = ? AND address = ?", key[:2])
+            self.total_bytes += size
+            self._evict()
+    
+    def peek(self, chain_id: str, address: str, tag: Optional[str] = None) -> Optional[str]:
+        """只读检查缓存状态 (不更新访问时间和命中统计)，返回 hit、negative 或 None"""
+        key = self.make_key(chain_id, address, tag)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT created_at FROM responses WHERE chain_id = ? AND address = ? "
+                "ORDER BY tag = ? DESC, created_at DESC LIMIT 1", key
+            ).fetchone()
+            if row is not None and (self.ttl <= 0 or now - row[0] <= self.ttl):
+                return "hit"
+            row = self.conn.execute(
+                "SELECT expires_at FROM negative WHERE chain_id = ? AND address = ? "
+                "ORDER BY tag = ? DESC, created_at DESC LIMIT 1", key
+            ).fetchone()
+        return "negative" if row is not None and row[0] > now else None
+    
+    def get_negative(self, chain_id: str, address: str, tag: Optional[str] = None) -> Optional[Dict]:
+        """读取负缓存，返回 {reason, message, created_at, expires_at}，没有记录或已过期返回 None"""
+        key = self.make_key(chain_id, address, tag)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT rowid, reason, message, created_at, expires_at FROM negative WHERE chain_id = ? AND address = ? "
+                "ORDER BY tag = ? DESC, created_at DESC LIMIT 1", key
+            ).fetchone()
+            if row is None:
+                return None
+            if row[4] <= time.time():
+                self.conn.execute("DELETE FROM negative WHERE rowid = ?", (row[0],))
+                return None
+            self.negative_hits += 1
+        return {"reason": row[1], "message": row[2], "created_at": row[3], "expires_at": row[4]}
+    
+    def put_negative(self, chain_id: str, address: str, tag: Optional[str], reason: str, message: str = ""):
+        """记录没有源代码的结果 (reason 为 NEGATIVE_REASONS 中的原因代码)"""
+        if self.negative_ttl <= 0:
+            return
+        key = self.make_key(chain_id, address, tag)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO negative (chain_id, address, tag, reason, message, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", key + (reason, message, now, now + self.negative_ttl)
+            )
+    
+    def _evict(self):
+        """LRU 淘汰，直到总大小回到上限以内 (调用方持有锁)"""
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT rowid, size FROM responses ORDER BY accessed_at LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            for rowid, size in rows:
+                self.conn.execute("DELETE FROM responses WHERE rowid = ?", (rowid,))
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    break
+    
+    def close(self):
+        self.conn.close()
+
+
+class BatchJournal:
+    """批量下载的追加写检查点日志 (JSON Lines)
+    
+    每个合约完成 (成功或失败) 后立即追加一行并 fsync，
+    进程崩溃或中断后可通过 resume 跳过已成功的合约，只重试失败和未完成的合约。
+    """
+    
+    def __init__(self, path: Path, resume: bool = False):
+        self.path = Path(path)
+        self.completed: Dict[str, bool] = self.load_completed(self.path) if resume else {}
+        self.file = open(self.path, "a" if resume else "w", encoding="utf-8")
+    
+    @staticmethod
+    def load_completed(path: Path) -> Dict[str, bool]:
+        """读取检查点日志，返回 {条目标识: 是否成功} (只读)"""
+        completed = {}
+        if not Path(path).exists():
+            return completed
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时可能留下不完整的最后一行
+                    continue
+                completed[record["id"]] = record["status"] == "success"
+        return completed
+    
+    @staticmethod
+    def entry_id(contract: Dict, index: int) -> str:
+        """批量条目的稳定标识，跨多次运行保持不变"""
+        block_number = contract.get('height') or contract.get('block') or ''
+        return "|".join([
+            str(contract.get('name', f'Contract_{index}')),
+            str(contract.get('chain', '')).lower(),
+            str(contract.get('address', '')).lower(),
+            str(block_number)
+        ])
+    
+    def is_done(self, entry_id: str) -> bool:
+        return self.completed.get(entry_id, False)
+    
+    def record(self, entry_id: str, contract_key: str, success: bool):
+        record = {
+            "id": entry_id,
+            "key": contract_key,
+            "status": "success" if success else "failed",
+            "time": time.time()
+        }
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.completed[entry_id] = success
+    
+    def close(self):
+        self.file.close()
+
+
+class SQLiteWorkQueue:
+    """基于 SQLite 文件的分布式工作队列
+    
+    协调者把批量条目写入队列，多个工作进程按租约领取: 工作进程定期续约，
+    租约过期 (进程崩溃或失联) 的条目可被其他工作进程重新领取，领取超过 max_attempts 次仍未完成的条目记为失败。
+    SQLite 依赖文件锁，适合同一主机上的多个进程；跨主机的共享存储 (NFS 等) 请使用 DirectoryWorkQueue。
+    """
+    
+    def __init__(self, path: Path, max_attempts: int = 3):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max(1, max_attempts)
+        self.lock = threading.Lock()
+        
+        # 自动提交模式，领取等写操作显式使用 BEGIN IMMEDIATE 事务
+        self.conn = sqlite3.connect(str(self.path), timeout=60, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "  id INTEGER PRIMARY KEY, entry TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending',"
+            "  worker TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0,"
+            "  contract_id TEXT, error TEXT, updated_at REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status, id)")
+    
+    def enqueue(self, entries: Iterable[Dict]) -> int:
+        """写入批量条目，未指定名称的条目按队列中的序号命名 (Contract_<序号>)，返回写入数量"""
+        count = 0
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                next_id = (self.conn.execute("SELECT MAX(id) FROM items").fetchone()[0] or 0) + 1
+                for entry in entries:
+                    item_id = next_id + count
+                    entry = dict(entry)
+                    entry.setdefault("name", f"Contract_{item_id}")
+                    self.conn.execute(
+                        "INSERT INTO items (id, entry, updated_at) VALUES (?, ?, ?)",
+                        (item_id, json.dumps(entry, ensure_ascii=False), time.time())
+                    )
+                    count += 1
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return count
+    
+    def claim(self, worker: str, limit: int, lease_seconds: float) -> List[Tuple[int, Dict]]:
+        """领取最多 limit 个待处理或租约已过期的条目，返回 [(条目标识, 条目)]"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "UPDATE items SET status = 'failed', error = 'lease expired', updated_at = ? "
+                    "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                    (now, now, self.max_attempts)
+                )
+                rows = self.conn.execute(
+                    "SELECT id, entry FROM items WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+                    "ORDER BY id LIMIT ?", (now, limit)
+                ).fetchall()
+                self.conn.executemany(
+                    "UPDATE items SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    [(worker, now + lease_seconds, now, row[0]) for row in rows]
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [(row[0], json.loads(row[1])) for row in rows]
+    
+    def renew(self, worker: str, handles: List[int], lease_seconds: float):
+        """续约仍由该工作进程持有的条目"""
+        lease_until = time.time() + lease_seconds
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE items SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                [(lease_until, handle, worker) for handle in handles]
+            )
+    
+    def complete(self, handle: int, worker: str, success: bool, contract_id: str, error: Optional[str] = None):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE items SET status = ?, worker = ?, contract_id = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+                ("done" if success else "failed", worker, contract_id, error, time.time(), handle)
+            )
+    
+    def has_work(self) -> bool:
+        """是否还有待处理或正在处理的条目"""
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM items WHERE status IN ('pending', 'leased') LIMIT 1").fetchone()
+        return row is not None
+    
+    def report(self, max_failures: int = 20) -> Dict:
+        """队列汇总: 各状态数量、各工作进程完成数量和部分失败条目"""
+        with self.lock:
+            statuses = dict(self.conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+            workers = {}
+            for worker, status, count in self.conn.execute(
+                "SELECT worker, status, COUNT(*) FROM items WHERE status IN ('done', 'failed') GROUP BY worker, status"
+            ):
+                workers.setdefault(worker or "-", {})[status] = count
+            failures = [
+                {"id": row[0], "entry": json.loads(row[1]), "worker": row[2], "error": row[3]}
+                for row in self.conn.execute(
+                    "SELECT id, entry, worker, error FROM items WHERE status = 'failed' ORDER BY id LIMIT ?", (max_failures,)
+                )
+            ]
+        return {"statuses": statuses, "workers": workers, "failures": failures}
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class DirectoryWorkQueue:
+    """基于目录的分布式工作队列，适用于多台主机共享的网络存储 (不依赖文件锁)
+    
+    每个条目是一个 JSON 文件，领取、过期回收和完成都通过原子重命名实现:
+    pending/<序号>.<领取次数>.json -> leased/ (文件修改时间即租约到期时间) -> done/<序号>.json (结果记录)。
+    """
+    
+    def __init__(self, path: Path, max_attempts: int = 3):
+        self.path = Path(path)
+        self.max_attempts = max(1, max_attempts)
+        self.pending_dir = self.path / "pending"
+        self.leased_dir = self.path / "leased"
+        self.done_dir = self.path / "done"
+        for directory in (self.pending_dir, self.leased_dir, self.done_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+    
+    @staticmethod
+    def _parse_name(name: str) -> Tuple[int, int]:
+        item_id, attempts, _ = name.split(".")
+        return int(item_id), int(attempts)
+    
+    def _write_atomic(self, path: Path, data: Dict):
+        tmp_path = path.with_name(f".{path.name}.{socket.gethostname()}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    
+    def enqueue(self, entries: Iterable[Dict]) -> int:
+        """写入批量条目，未指定名称的条目按队列中的序号命名 (Contract_<序号>)，返回写入数量
+        
+        同一时间只应有一个协调者写入队列。
+        """
+        existing = [
+            int(name.split(".")[0]) for directory in (self.pending_dir, self.leased_dir, self.done_dir)
+            for name in os.listdir(directory) if not name.startswith(".")
+        ]
+        next_id = max(existing, default=0) + 1
+        count = 0
+        for entry in entries:
+            item_id = next_id + count
+            entry = dict(entry)
+            entry.setdefault("name", f"Contract_{item_id}")
+            self._write_atomic(self.pending_dir / f"{item_id:010d}.0.json", entry)
+            count += 1
+        return count
+    
+    def _finish(self, item_id: int, record: Dict):
+        self._write_atomic(self.done_dir / f"{item_id:010d}.json", record)
+    
+    def _reclaim_expired(self):
+        """租约过期的条目放回 pending (领取次数用完则记为失败)"""
+        now = time.time()
+        for name in os.listdir(self.leased_dir):
+            if name.startswith("."):
+                continue
+            leased_path = self.leased_dir / name
+            try:
+                if leased_path.stat().st_mtime >= now:
+                    continue
+                item_id, attempts = self._parse_name(name)
+                if attempts < self.max_attempts:
+                    os.rename(leased_path, self.pending_dir / name)
+                    continue
+                with open(leased_path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                self._finish(item_id, {"id": item_id, "entry": entry, "success": False, "worker": None,
+                                       "contract_id": None, "error": "lease expired", "finished_at": now})
+                leased_path.unlink()
+            except (FileNotFoundError, ValueError):
+                # 已被其他工作进程回收或完成
+                continue
+    
+    def claim(self, worker: str, limit: int, lease_seconds: float) -> List[Tuple[str, Dict]]:
+        """领取最多 limit 个待处理或租约已过期的条目，返回 [(条目标识, 条目)]"""
+        self._reclaim_expired()
+        lease_until = time.time() + lease_seconds
+        claimed = []
+        for name in sorted(os.listdir(self.pending_dir)):
+            if len(claimed) >= limit:
+                break
+            if name.startswith("."):
+                continue
+            item_id, attempts = self._parse_name(name)
+            handle = f"{item_id:010d}.{attempts + 1}.json"
+            try:
+                # 先设置租约到期时间再移动，避免其他进程把刚领取的条目当作过期回收
+                os.utime(self.pending_dir / name, (lease_until, lease_until))
+                os.rename(self.pending_dir / name, self.leased_dir / handle)
+            except FileNotFoundError:
+                continue
+            with open(self.leased_dir / handle, "r", encoding="utf-8") as f:
+                claimed.append((handle, json.load(f)))
+        return claimed
+    
+    def renew(self, worker: str, handles: List[str], lease_seconds: float):
+        lease_until = time.time() + lease_seconds
+        for handle in handles:
+            try:
+                os.utime(self.leased_dir / handle, (lease_until, lease_until))
+            except FileNotFoundError:
+                # 租约已过期并被回收，继续处理 (输出是幂等的)
+                continue
+    
+    def complete(self, handle: str, worker: str, success: bool, contract_id: str, error: Optional[str] = None):
+        item_id, _ = self._parse_name(handle)
+        leased_path = self.leased_dir / handle
+        try:
+            with open(leased_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            entry = None
+        self._finish(item_id, {"id": item_id, "entry": entry, "success": success, "worker": worker,
+                               "contract_id": contract_id, "error": error, "finished_at": time.time()})
+        try:
+            leased_path.unlink()
+        except FileNotFoundError:
+            pass
+    
+    def has_work(self) -> bool:
+        return any(not name.startswith(".") for directory in (self.pending_dir, self.leased_dir) for name in os.listdir(directory))
+    
+    def report(self, max_failures: int = 20) -> Dict:
+        statuses = {
+            "pending": sum(1 for name in os.listdir(self.pending_dir) if not name.startswith(".")),
+            "leased": sum(1 for name in os.listdir(self.leased_dir) if not name.startswith(".")),
+        }
+        workers = {}
+        failures = []
+        for name in sorted(os.listdir(self.done_dir)):
+            if name.startswith("."):
+                continue
+            with open(self.done_dir / name, "r", encoding="utf-8") as f:
+                record = json.load(f)
+            status = "done" if record["success"] else "failed"
+            statuses[status] = statuses.get(status, 0) + 1
+            counts = workers.setdefault(record.get("worker") or "-", {})
+            counts[status] = counts.get(status, 0) + 1
+            if status == "failed" and len(failures) < max_failures:
+                failures.append({key: record.get(key) for key in ("id", "entry", "worker", "error")})
+        return {"statuses": statuses, "workers": workers, "failures": failures}
+    
+    def close(self):
+        pass
+
+
+def open_work_queue(path, max_attempts: Optional[int] = None):
+    """打开工作队列: .sqlite / .db 文件使用 SQLiteWorkQueue，其他路径作为 DirectoryWorkQueue 目录"""
+    path = Path(path)
+    if max_attempts is None:
+        max_attempts = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+    if path.suffix.lower() in (".sqlite", ".sqlite3", ".db"):
+        return SQLiteWorkQueue(path, max_attempts)
+    return DirectoryWorkQueue(path, max_attempts)
+
+
+# metadata.json 中 downloaded_at 的格式 (UTC)
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# 源文件压缩: gzip (标准库) 或 zstd (需要 zstandard 包)，输出是确定的 (相同内容压缩结果相同，可去重)
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_zstandard = None
+
+
+def _load_zstandard():
+    global _zstandard
+    if _zstandard is None:
+        import zstandard
+        _zstandard = zstandard
+    return _zstandard
+
+
+def resolve_compression(method: Optional[str]) -> str:
+    """规范化压缩方式 (none / gzip / zstd)，未安装 zstandard 时 zstd 退化为 gzip"""
+    method = (method or "none").lower()
+    if method != "none" and method not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"不支持的压缩方式 '{method}'，支持: none, {', '.join(COMPRESSION_SUFFIXES)}")
+    if method == "zstd":
+        try:
+            _load_zstandard()
+        except ImportError:
+            print("提示: 安装 zstandard 以使用 zstd 压缩，当前使用 gzip")
+            print("运行: pip install zstandard")
+            return "gzip"
+    return method
+
+
+def make_compressor(method: str, level: Optional[int] = None):
+    """返回带 compress()/flush() 的增量压缩器"""
+    if method == "gzip":
+        return zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+    if method == "zstd":
+        return _load_zstandard().ZstdCompressor(level=3 if level is None else level).compressobj()
+    raise ValueError(f"不支持的压缩方式 '{method}'")
+
+
+def compress_bytes(data: bytes, method: str, level: Optional[int] = None) -> bytes:
+    compressor = make_compressor(method, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress_bytes(data: bytes) -> bytes:
+    """按魔数识别 gzip / zstd 并解压，未压缩的数据原样返回"""
+    if data[:2] == GZIP_MAGIC:
+        return gzip.decompress(data)
+    if data[:4] == ZSTD_MAGIC:
+        try:
+            zstandard = _load_zstandard()
+        except ImportError:
+            raise RuntimeError("读取 zstd 压缩的文件需要安装 zstandard: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+class SourceStore:
+    """内容寻址的源文件存储
+    
+    相同内容的源文件只在 store_dir 中保存一份 (按 SHA-256 命名)，
+    合约目录中的文件是指向它的硬链接，目录结构保持不变、可直接浏览。
+    文件系统不支持硬链接时 (如跨设备) 退化为普通写入。
+    注意: 硬链接文件共享内容，不要原地修改下载的源文件。
+    """
+    
+    def __init__(self, store_dir: Path):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.files_linked = 0
+        self.blobs_written = 0
+        self.bytes_saved = 0
+        self.lock = threading.Lock()
+    
+    def blob_path(self, digest: str) -> Path:
+        return self.store_dir / digest[:2] / digest[2:]
+    
+    def _ensure_blob(self, data: bytes, fsync: bool = False) -> Tuple[Path, bool]:
+        """确保内容已存在于 store 中，返回 (blob 路径, 是否新写入)"""
+        blob = self.blob_path(hashlib.sha256(data).hexdigest())
+        if blob.exists():
+            return blob, False
+        
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = blob.with_name(f"{blob.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, blob)
+        return blob, True
+    
+    def write(self, target: Path, content, fsync: bool = False) -> bool:
+        """写入文件 (硬链接到 store)，返回是否复用了已有内容；fsync 为真时新写入的 blob 同步到磁盘
+        
+        content 为文本或已压缩的字节。
+        """
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        blob, created = self._ensure_blob(data, fsync)
+        
+        if target.exists() or target.is_symlink():
+            target.unlink()
+        try:
+            os.link(blob, target)
+        except OSError:
+            with open(target, "wb") as f:
+                f.write(data)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            return False
+        
+        with self.lock:
+            self.files_linked += 1
+            if created:
+                self.blobs_written += 1
+            else:
+                self.bytes_saved += len(data)
+        return not created
+
+
+class DirectoryBackend:
+    """目录输出后端 (默认): 每个合约一个目录，包含源文件、compiler_settings.json 和 metadata.json
+    
+    每个合约先完整写入输出目录下的临时目录 .partial-*，再重命名到目标位置，
+    中断时不会留下看似完整的半成品目录。多文件合约的源文件由 write_workers 个线程并行写入。
+    fsync_policy: none (交给操作系统)、contract (每个合约写完即同步) 或 batch (批量结束时统一同步)。
+    compression 为 gzip / zstd 时源文件压缩保存: file 模式下每个文件加 .gz / .zst 后缀，
+    bundle 模式下一个合约的全部源文件保存为一个 sources.json.gz / .zst ({路径: 内容})。
+    读取接口 (list_files / read_file / read_files) 对两种模式透明，最近读取的 bundle 解压结果会被缓存。
+    """
+    
+    name = "directory"
+    FSYNC_POLICIES = ("none", "contract", "batch")
+    COMPRESSION_MODES = ("file", "bundle")
+    BUNDLE_NAME = "sources.json"
+    PARTIAL_PREFIX = ".partial-"
+    # 超过该时间的临时目录视为异常中断的残留，启动时清理
+    STALE_PARTIAL_SECONDS = 24 * 3600
+    
+    def __init__(self, output_dir: Path, source_store: Optional[SourceStore] = None,
+                 fsync_policy: Optional[str] = None, write_workers: int = 4,
+                 compression: str = "none", compression_mode: str = "file", compression_level: Optional[int] = None):
+        fsync_policy = (fsync_policy or "none").lower()
+        if fsync_policy not in self.FSYNC_POLICIES:
+            raise ValueError(f"不支持的 fsync 策略 '{fsync_policy}'，支持: {', '.join(self.FSYNC_POLICIES)}")
+        if compression != "none" and compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"不支持的压缩方式 '{compression}'，支持: none, {', '.join(COMPRESSION_SUFFIXES)}")
+        if compression_mode not in self.COMPRESSION_MODES:
+            raise ValueError(f"不支持的压缩模式 '{compression_mode}'，支持: {', '.join(self.COMPRESSION_MODES)}")
+        self.output_dir = Path(output_dir)
+        self.compression = compression
+        self.compression_mode = compression_mode
+        self.compression_level = compression_level
+        self.source_store = source_store
+        self.fsync_policy = fsync_policy
+        self.write_workers = max(1, write_workers)
+        self.write_pool = None
+        if self.write_workers > 1:
+            self.write_pool = ThreadPoolExecutor(max_workers=self.write_workers, thread_name_prefix="file-writer")
+        self.batch_depth = 0
+        self.lock = threading.Lock()
+        # 最近解压的 bundle: (路径, (mtime_ns, 大小), {路径: 内容})，逐个读取同一合约的文件时只解压一次
+        self._bundle_cache: Optional[Tuple[Path, Tuple[int, int], Dict[str, str]]] = None
+        self._remove_stale_partials()
+    
+    def describe(self, contract: str, file_path: Optional[str] = None) -> str:
+        location = self.output_dir / contract
+        return str(location / file_path) if file_path else str(location)
+    
+    def _remove_stale_partials(self):
+        """清理异常中断留下的临时目录"""
+        if not self.output_dir.is_dir():
+            return
+        cutoff = time.time() - self.STALE_PARTIAL_SECONDS
+        for path in self.output_dir.iterdir():
+            try:
+                if path.name.startswith(self.PARTIAL_PREFIX) and path.is_dir() and path.stat().st_mtime < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+    
+    @staticmethod
+    def _fsync_dir(path: Path):
+        """同步目录项 (不支持打开目录的平台上忽略)"""
+        try:
+            fd = os.open(str(path), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    
+    def _write_source_file(self, file_path: Path, content: str):
+        """写入源文件 (按需压缩)，启用内容寻址存储时硬链接到共享的 blob"""
+        fsync = self.fsync_policy == "contract"
+        data = content
+        if self.compression != "none":
+            file_path = file_path.with_name(file_path.name + COMPRESSION_SUFFIXES[self.compression])
+            data = compress_bytes(content.encode("utf-8"), self.compression, self.compression_level)
+        if self.source_store is not None:
+            self.source_store.write(file_path, data, fsync=fsync)
+            return
+        f = open(file_path, "w", encoding="utf-8") if isinstance(data, str) else open(file_path, "wb")
+        with f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+    
+    def _write_json(self, file_path: Path, data):
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            if self.fsync_policy == "contract":
+                f.flush()
+                os.fsync(f.fileno())
+    
+    def _write_files(self, contract_dir: Path, files) -> set:
+        """写入所有源文件，返回创建的目录集合
+        
+        多个文件时提交给写入线程池并行写入，未完成的写入最多 2 × write_workers 个，
+        避免逐个解码的大体积 SourceFileStream 在内存中堆积。
+        """
+        if self.compression != "none" and self.compression_mode == "bundle":
+            self._write_bundle(contract_dir, files)
+            return {contract_dir}
+        
+        directories = {contract_dir}
+        pending = deque()
+        try:
+            for file_path, content in files.items():
+                if isinstance(files, SourceFileStream) and files.discarded:
+                    # 标准 JSON 中途解析失败，回退为单个文件: 等待并删除已写入的部分文件
+                    wait(pending)
+                    while pending:
+                        pending.popleft().result()
+                    self._clear_dir(contract_dir)
+                    directories = {contract_dir}
+                file_full_path = contract_dir / file_path
+                if file_full_path.parent not in directories:
+                    file_full_path.parent.mkdir(parents=True, exist_ok=True)
+                    directories.add(file_full_path.parent)
+                if self.write_pool is None:
+                    self._write_source_file(file_full_path, content)
+                    continue
+                pending.append(self.write_pool.submit(self._write_source_file, file_full_path, content))
+                if len(pending) >= 2 * self.write_workers:
+                    pending.popleft().result()
+        finally:
+            # 出错时也要等待已提交的写入结束，再由调用方删除临时目录
+            wait(pending)
+        for future in pending:
+            future.result()
+        return directories
+    
+    @staticmethod
+    def _clear_dir(directory: Path):
+        """删除目录中的全部内容 (只用于临时目录)"""
+        for child in directory.iterdir():
+            if child.is_dir() and not child.is_symlink():
+                shutil.rmtree(child)
+            else:
+                child.unlink()
+    
+    def _write_bundle(self, contract_dir: Path, files):
+        """把全部源文件以 JSON 对象的形式增量压缩写入一个文件"""
+        compressor = make_compressor(self.compression, self.compression_level)
+        bundle_path = contract_dir / (self.BUNDLE_NAME + COMPRESSION_SUFFIXES[self.compression])
+        with open(bundle_path, "wb") as f:
+            separator = "{"
+            for file_path, content in files.items():
+                if isinstance(files, SourceFileStream) and files.discarded:
+                    # 回退为单个文件: 丢弃已压缩写入的部分内容，从头开始
+                    f.seek(0)
+                    f.truncate()
+                    compressor = make_compressor(self.compression, self.compression_level)
+                    separator = "{"
+                entry = separator + json.dumps(file_path, ensure_ascii=False) + ":" + json.dumps(content, ensure_ascii=False)
+                f.write(compressor.compress(entry.encode("utf-8")))
+                separator = ","
+            f.write(compressor.compress(b"{}" if separator == "{" else b"}"))
+            f.write(compressor.flush())
+            if self.fsync_policy == "contract":
+                f.flush()
+                os.fsync(f.fileno())
+    
+    def _replace_dir(self, partial_dir: Path, contract_dir: Path):
+        """把写好的临时目录换到目标位置，保留旧目录中的实现合约链接"""
+        with self.lock:
+            if not contract_dir.exists() and not contract_dir.is_symlink():
+                os.rename(partial_dir, contract_dir)
+                return
+            
+            for name in ("implementation", "implementation.link"):
+                old_link = contract_dir / name
+                if (old_link.is_symlink() or old_link.exists()) and not (partial_dir / name).exists():
+                    os.rename(old_link, partial_dir / name)
+            retired_dir = partial_dir.with_name(partial_dir.name + ".old")
+            os.rename(contract_dir, retired_dir)
+            os.rename(partial_dir, contract_dir)
+        shutil.rmtree(retired_dir, ignore_errors=True)
+    
+    def write_contract(self, contract: str, files, settings: Optional[Dict], metadata: Dict):
+        """写入一个合约: 先写源文件和编译器设置，最后写 metadata.json，完成后整体替换合约目录
+        
+        files 为 {路径: 内容} 或 SourceFileStream (逐个解码写入，编译器设置在写完源文件后确定)。
+        """
+        contract_dir = self.output_dir / contract
+        partial_dir = self.output_dir / f"{self.PARTIAL_PREFIX}{contract}-{os.getpid()}-{threading.get_ident()}"
+        if partial_dir.exists():
+            shutil.rmtree(partial_dir)
+        partial_dir.mkdir()
+        
+        try:
+            directories = self._write_files(partial_dir, files)
+            
+            if isinstance(files, SourceFileStream):
+                settings = files.settings
+            if settings is not None:
+                self._write_json(partial_dir / "compiler_settings.json", settings)
+            self._write_json(partial_dir / "metadata.json", metadata)
+            
+            if self.fsync_policy == "contract":
+                for directory in directories:
+                    self._fsync_dir(directory)
+            self._replace_dir(partial_dir, contract_dir)
+        except BaseException:
+            shutil.rmtree(partial_dir, ignore_errors=True)
+            raise
+        
+        if self.fsync_policy == "contract":
+            self._fsync_dir(self.output_dir)
+        elif self.fsync_policy == "batch" and self.batch_depth == 0:
+            self._sync()
+    
+    def _sync(self):
+        """批量同步: 一次性把缓存的写入刷到磁盘"""
+        if hasattr(os, "sync"):
+            os.sync()
+    
+    def link_implementation(self, contract: str, implementation: str):
+        """在代理合约目录中创建指向实现合约目录的符号链接 implementation
+        
+        不支持符号链接时写入 implementation.link 文本文件记录实现合约目录名。
+        """
+        link_path = self.output_dir / contract / "implementation"
+        if not link_path.parent.is_dir():
+            return
+        if link_path.is_symlink() or link_path.exists():
+            link_path.unlink()
+        try:
+            os.symlink(Path("..") / implementation, link_path, target_is_directory=True)
+        except OSError:
+            with open(link_path.with_suffix(".link"), "w", encoding="utf-8") as f:
+                f.write(implementation + "\n")
+    
+    def begin_batch(self):
+        with self.lock:
+            self.batch_depth += 1
+    
+    def end_batch(self):
+        with self.lock:
+            self.batch_depth = max(0, self.batch_depth - 1)
+            sync = self.batch_depth == 0 and self.fsync_policy == "batch"
+        if sync:
+            self._sync()
+    
+    def close(self):
+        if self.write_pool is not None:
+            self.write_pool.shutdown(wait=True)
+            self.write_pool = None
+    
+    def list_contracts(self) -> List[str]:
+        """列出已保存的合约 (含 metadata.json 的目录)"""
+        return sorted(
+            path.name for path in self.output_dir.iterdir()
+            if path.is_dir() and not path.name.startswith(".") and (path / "metadata.json").exists()
+        )
+    
+    def read_metadata(self, contract: str) -> Optional[Dict]:
+        metadata_path = self.output_dir / contract / "metadata.json"
+        if not metadata_path.exists():
+            return None
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    
+    def _bundle_path(self, contract: str) -> Optional[Path]:
+        for suffix in COMPRESSION_SUFFIXES.values():
+            bundle_path = self.output_dir / contract / (self.BUNDLE_NAME + suffix)
+            if bundle_path.is_file():
+                return bundle_path
+        return None
+    
+    def _read_bundle(self, bundle_path: Path) -> Dict[str, str]:
+        stat = bundle_path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = self._bundle_cache
+        if cached is not None and cached[0] == bundle_path and cached[1] == stamp:
+            return cached[2]
+        with open(bundle_path, "rb") as f:
+            files = json.loads(decompress_bytes(f.read()).decode("utf-8"))
+        self._bundle_cache = (bundle_path, stamp, files)
+        return files
+    
+    def list_files(self, contract: str) -> List[str]:
+        """列出合约的源文件路径 (压缩文件返回去掉 .gz / .zst 后缀的原始路径)"""
+        contract_dir = self.output_dir / contract
+        if not contract_dir.is_dir():
+            return []
+        bundle_path = self._bundle_path(contract)
+        paths = set(self._read_bundle(bundle_path)) if bundle_path else set()
+        suffixes = tuple(COMPRESSION_SUFFIXES.values())
+        for path in contract_dir.rglob("*"):
+            if not path.is_file() or path == bundle_path or path.name in ("metadata.json", "compiler_settings.json"):
+                continue
+            relative = path.relative_to(contract_dir).as_posix()
+            if path.name.endswith(suffixes):
+                relative = relative.rsplit(".", 1)[0]
+            paths.add(relative)
+        return sorted(paths)
+    
+    def read_file(self, contract: str, file_path: str) -> Optional[str]:
+        """读取源文件内容，自动解压 file / bundle 模式保存的文件"""
+        full_path = self.output_dir / contract / file_path
+        if full_path.is_file():
+            with open(full_path, "r", encoding="utf-8") as f:
+                return f.read()
+        for suffix in COMPRESSION_SUFFIXES.values():
+            compressed_path = full_path.with_name(full_path.name + suffix)
+            if compressed_path.is_file():
+                with open(compressed_path, "rb") as f:
+                    return decompress_bytes(f.read()).decode("utf-8")
+        bundle_path = self._bundle_path(contract)
+        if bundle_path:
+            return self._read_bundle(bundle_path).get(file_path)
+        return None
+    
+    def read_files(self, contract: str) -> Dict[str, str]:
+        """读取合约的全部源文件 {路径: 内容} (bundle 只解压一次)"""
+        return {path: self.read_file(contract, path) for path in self.list_files(contract)}
+
+
+class SQLiteBackend:
+    """SQLite 单文件输出后端
+    
+    整个语料库保存在一个数据库文件中，便于存储和传输。源文件内容按 SHA-256 去重保存。
+    批量下载期间每 batch_size 个合约提交一次事务，批量外的写入立即提交。
+    每个合约在保存点 (SAVEPOINT) 内写入，中途失败时只回滚该合约，旧版本保持不变，
+    不会把写了一半的合约随同批次的其他合约一起提交；fsync_policy 为 contract 时每个合约单独提交，
+    为 none 时关闭 SQLite 的同步 (PRAGMA synchronous=OFF)，默认 (batch) 保持按批提交。
+    compression 为 gzip / zstd 时源文件内容压缩后保存为 BLOB (去重仍按原文的 SHA-256)，
+    读取时按魔数自动解压，新旧数据可混合存放。
+    """
+    
+    name = "sqlite"
+    
+    def __init__(self, db_path: Path, batch_size: int = 100, fsync_policy: Optional[str] = None,
+                 compression: str = "none", compression_level: Optional[int] = None):
+        fsync_policy = (fsync_policy or "batch").lower()
+        if fsync_policy not in DirectoryBackend.FSYNC_POLICIES:
+            raise ValueError(f"不支持的 fsync 策略 '{fsync_policy}'，支持: {', '.join(DirectoryBackend.FSYNC_POLICIES)}")
+        if compression != "none" and compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"不支持的压缩方式 '{compression}'，支持: none, {', '.join(COMPRESSION_SUFFIXES)}")
+        self.compression = compression
+        self.compression_level = compression_level
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.fsync_policy = fsync_policy
+        self.batch_size = 1 if fsync_policy == "contract" else max(1, batch_size)
+        self.batch_depth = 0
+        self.uncommitted = 0
+        self.lock = threading.Lock()
+        
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        if fsync_policy == "none":
+            self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS contracts ("
+            "  name TEXT PRIMARY KEY, metadata TEXT NOT NULL, settings TEXT, updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "  digest TEXT PRIMARY KEY, content TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS files ("
+            "  contract TEXT NOT NULL, path TEXT NOT NULL, digest TEXT NOT NULL,"
+            "  PRIMARY KEY (contract, path));"
+            "CREATE TABLE IF NOT EXISTS implementations ("
+            "  contract TEXT PRIMARY KEY, implementation TEXT NOT NULL);"
+        )
+        self.conn.commit()
+    
+    def describe(self, contract: str, file_path: Optional[str] = None) -> str:
+        return f"{self.db_path}:{contract}/{file_path}" if file_path else f"{self.db_path}:{contract}"
+    
+    def write_contract(self, contract: str, files, settings: Optional[Dict], metadata: Dict):
+        """写入一个合约 (files 为 {路径: 内容} 或 SourceFileStream，逐个文件写入)"""
+        with self.lock:
+            # 保存点在批次事务内部；没有打开的事务时先显式开始，避免 RELEASE 直接提交
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
+            self.conn.execute("SAVEPOINT write_contract")
+            try:
+                self.conn.execute("DELETE FROM files WHERE contract = ?", (contract,))
+                for file_path, content in files.items():
+                    if isinstance(files, SourceFileStream) and files.discarded:
+                        # 回退为单个文件: 删除已写入的部分文件
+                        self.conn.execute("DELETE FROM files WHERE contract = ?", (contract,))
+                    data = content.encode("utf-8")
+                    digest = hashlib.sha256(data).hexdigest()
+                    if self.compression != "none":
+                        content = sqlite3.Binary(compress_bytes(data, self.compression, self.compression_level))
+                    self.conn.execute("INSERT OR IGNORE INTO blobs (digest, content) VALUES (?, ?)", (digest, content))
+                    self.conn.execute("INSERT OR REPLACE INTO files (contract, path, digest) VALUES (?, ?, ?)", (contract, file_path, digest))
+                if isinstance(files, SourceFileStream):
+                    settings = files.settings
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO contracts (name, metadata, settings, updated_at) VALUES (?, ?, ?, ?)",
+                    (contract, json.dumps(metadata, ensure_ascii=False),
+                     json.dumps(settings, ensure_ascii=False) if settings is not None else None, time.time())
+                )
+            except BaseException:
+                self.conn.execute("ROLLBACK TO write_contract")
+                self.conn.execute("RELEASE write_contract")
+                raise
+            self.conn.execute("RELEASE write_contract")
+            self.uncommitted += 1
+            if self.batch_depth == 0 or self.uncommitted >= self.batch_size:
+                self.conn.commit()
+                self.uncommitted = 0
+    
+    def link_implementation(self, contract: str, implementation: str):
+        """记录代理合约指向的实现合约"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO implementations (contract, implementation) VALUES (?, ?)",
+                (contract, implementation)
+            )
+            if self.batch_depth == 0:
+                self.conn.commit()
+    
+    def read_implementation(self, contract: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT implementation FROM implementations WHERE contract = ?", (contract,)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def begin_batch(self):
+        with self.lock:
+            self.batch_depth += 1
+    
+    def end_batch(self):
+        with self.lock:
+            self.batch_depth = max(0, self.batch_depth - 1)
+            self.conn.commit()
+            self.uncommitted = 0
+    
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+    
+    def list_contracts(self) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT name FROM contracts ORDER BY name")]
+    
+    def read_metadata(self, contract: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute("SELECT metadata FROM contracts WHERE name = ?", (contract,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def list_files(self, contract: str) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.conn.execute(
+                "SELECT path FROM files WHERE contract = ? ORDER BY path", (contract,)
+            )]
+    
+    def read_file(self, contract: str, file_path: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT blobs.content FROM files JOIN blobs ON files.digest = blobs.digest "
+                "WHERE files.contract = ? AND files.path = ?", (contract, file_path)
+            ).fetchone()
+        if row is None:
+            return None
+        return decompress_bytes(row[0]).decode("utf-8") if isinstance(row[0], bytes) else row[0]
+    
+    def read_files(self, contract: str) -> Dict[str, str]:
+        """读取合约的全部源文件 {路径: 内容}"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT files.path, blobs.content FROM files JOIN blobs ON files.digest = blobs.digest "
+                "WHERE files.contract = ? ORDER BY files.path", (contract,)
+            ).fetchall()
+        return {path: decompress_bytes(content).decode("utf-8") if isinstance(content, bytes) else content for path, content in rows}
+
+
+class MetadataIndex:
+    """合约元数据索引 (SQLite)
+    
+    保存合约时同步写入名称、地址、链、编译器版本、优化、许可证、代理等字段，
+    用于按条件快速查询语料库，无需遍历所有 metadata.json。
+    """
+    
+    COLUMNS = [
+        "contract", "contract_name", "address", "chain_id", "chain_name", "compiler_version",
+        "optimization", "runs", "license", "proxy", "implementation", "block_number", "location", "updated_at"
+    ]
+    
+    def __init__(self, db_path: Path, batch_size: int = 100, timeout: float = 30.0):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = max(1, batch_size)
+        self.batch_depth = 0
+        self.uncommitted = 0
+        self.lock = threading.Lock()
+        
+        # 多个工作进程可能共享同一个索引，等待写锁的时间比 sqlite3 默认的 5 秒更长
+        self.conn = sqlite3.connect(str(self.db_path), timeout=timeout, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS contracts ("
+            "  contract TEXT PRIMARY KEY, contract_name TEXT, address TEXT, chain_id TEXT, chain_name TEXT,"
+            "  compiler_version TEXT, optimization INTEGER, runs INTEGER, license TEXT,"
+            "  proxy INTEGER, implementation TEXT, block_number TEXT, location TEXT, updated_at REAL);"
+            "CREATE INDEX IF NOT EXISTS contracts_address ON contracts (address, chain_id);"
+            "CREATE INDEX IF NOT EXISTS contracts_compiler ON contracts (compiler_version);"
+            "CREATE INDEX IF NOT EXISTS contracts_proxy ON contracts (proxy);"
+        )
+        self.conn.commit()
+    
+    @staticmethod
+    def _to_int(value) -> Optional[int]:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    
+    def add(self, contract: str, metadata: Dict, location: str = ""):
+        """写入或更新一个合约的索引记录"""
+        row = (
+            contract,
+            metadata.get("contract_name", ""),
+            str(metadata.get("contract_address", "")).lower(),
+            str(metadata.get("chain_id", "")),
+            metadata.get("chain_name", ""),
+            metadata.get("compiler_version", ""),
+            self._to_int(metadata.get("optimization_used")),
+            self._to_int(metadata.get("runs")),
+            metadata.get("license_type", ""),
+            self._to_int(metadata.get("proxy")) or 0,
+            str(metadata.get("implementation", "")).lower(),
+            metadata.get("block_number"),
+            location,
+            time.time()
+        )
+        with self.lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO contracts ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(self.COLUMNS))})", row
+            )
+            self.uncommitted += 1
+            if self.batch_depth == 0 or self.uncommitted >= self.batch_size:
+                self.conn.commit()
+                self.uncommitted = 0
+    
+    def begin_batch(self):
+        with self.lock:
+            self.batch_depth += 1
+    
+    def end_batch(self):
+        with self.lock:
+            self.batch_depth = max(0, self.batch_depth - 1)
+            self.conn.commit()
+            self.uncommitted = 0
+    
+    def query(self, chain_id: Optional[str] = None, compiler: Optional[str] = None,
+              optimization: Optional[bool] = None, proxy: Optional[bool] = None,
+              license_type: Optional[str] = None, name: Optional[str] = None,
+              address: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """按条件查询索引，compiler 为版本前缀 (如 "0.8" 匹配 v0.8.x) 或完整版本 (如 "0.8.2" 只匹配 v0.8.2，不匹配 v0.8.20)"""
+        conditions = []
+        params: List = []
+        if chain_id:
+            conditions.append("chain_id = ?")
+            params.append(str(chain_id))
+        if compiler:
+            version = compiler.lstrip("v").rstrip("x*").rstrip(".")
+            if version.count(".") < 2:
+                conditions.append("compiler_version LIKE ?")
+                params.append(f"v{version}.%")
+            elif "+" in version:
+                conditions.append("compiler_version = ?")
+                params.append(f"v{version}")
+            else:
+                # 完整版本号: 精确匹配，或后接 +commit / -nightly 等构建信息
+                conditions.append("(compiler_version = ? OR compiler_version LIKE ? OR compiler_version LIKE ?)")
+                params.extend([f"v{version}", f"v{version}+%", f"v{version}-%"])
+        if optimization is not None:
+            conditions.append("optimization = ?")
+            params.append(1 if optimization else 0)
+        if proxy is not None:
+            conditions.append("proxy = ?")
+            params.append(1 if proxy else 0)
+        if license_type:
+            conditions.append("license = ? COLLATE NOCASE")
+            params.append(license_type)
+        if name:
+            conditions.append("(contract_name LIKE ? OR contract LIKE ?)")
+            params.extend([f"%{name}%", f"%{name}%"])
+        if address:
+            conditions.append("(address = ? OR implementation = ?)")
+            params.extend([address.lower(), address.lower()])
+        
+        sql = f"SELECT {', '.join(self.COLUMNS)} FROM contracts"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY contract"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        
+        with self.lock:
+            return [dict(zip(self.COLUMNS, row)) for row in self.conn.execute(sql, params)]
+    
+    def rebuild(self, backend) -> int:
+        """从输出后端中已有的 metadata 重建索引，返回索引的合约数"""
+        count = 0
+        self.begin_batch()
+        try:
+            with self.lock:
+                self.conn.execute("DELETE FROM contracts")
+            for contract in backend.list_contracts():
+                metadata = backend.read_metadata(contract)
+                if metadata:
+                    self.add(contract, metadata, backend.describe(contract))
+                    count += 1
+        finally:
+            self.end_batch()
+        return count
+    
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+class SourceFileStream:
+    """逐个解码 SourceCode 中的源文件
+    
+    标准 JSON 输入 ({{...}} 或 {...}) 按 sources 中的条目逐个解码，不切片复制整个 SourceCode，
+    写入时同一时刻只保留一个文件的内容。items() 逐个返回 (相对路径, 内容)，只能迭代一次；
+    迭代结束后 settings 为编译器设置 (单文件或无法解析时为 None)，paths 为已返回的文件路径。
+    单文件或无法解析的内容作为 <合约名>.sol 返回，此时 standard_json 为 False。
+    标准 JSON 在已返回部分文件后才解析失败时，这些文件移入 discarded，随后返回 <合约名>.sol (最后一个文件)；
+    写入方看到 discarded 非空时应先删除已写入的文件，保证与 parse_source_code 的结果一致。
+    """
+    
+    _decoder = json.JSONDecoder()
+    _whitespace = re.compile(r"[ \t\n\r]*")
+    
+    def __init__(self, source_code: str, contract_name: str):
+        self.source_code = source_code
+        self.main_file = f"{contract_name}.sol"
+        self.settings: Optional[Dict] = None
+        self.paths: List[str] = []
+        self.discarded: List[str] = []
+        self.standard_json = False
+        self.decode_seconds = 0.0
+    
+    def items(self) -> Iterator[Tuple[str, str]]:
+        for file_path, content in self._iter_files():
+            self.paths.append(file_path)
+            yield file_path, content
+    
+    def _skip(self, pos: int) -> int:
+        return self._whitespace.match(self.source_code, pos).end()
+    
+    def _expect(self, pos: int, char: str) -> int:
+        if self.source_code[pos] != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.source_code, pos)
+        return self._skip(pos + 1)
+    
+    def _fallback(self) -> Tuple[str, str]:
+        # 无法解析时保存为单个文件 ({{...}} 去掉外层大括号)
+        if self.source_code.startswith("{{"):
+            return self.main_file, self.source_code[1:-1]
+        return self.main_file, self.source_code
+    
+    def _iter_members(self, pos: int, on_member) -> Iterator[Tuple[str, str]]:
+        """解析 pos 处的 JSON 对象，每个键交给 on_member(键, 值位置) 处理，
+        on_member 返回 (生成的源文件迭代器, 值结束位置)；最后设置 self._end 为对象结束位置"""
+        text = self.source_code
+        pos = self._expect(pos, "{")
+        if text[pos] == "}":
+            self._end = pos + 1
+            return
+        while True:
+            if text[pos] != '"':
+                raise json.JSONDecodeError("Expecting property name enclosed in double quotes", text, pos)
+            key, pos = json.decoder.scanstring(text, pos + 1)
+            pos = self._expect(self._skip(pos), ":")
+            pos = yield from on_member(key, pos)
+            pos = self._skip(pos)
+            if text[pos] == "}":
+                self._end = pos + 1
+                return
+            pos = self._expect(pos, ",")
+    
+    def _decode(self, pos: int):
+        started = time.perf_counter()
+        value, end = self._decoder.raw_decode(self.source_code, pos)
+        self.decode_seconds += time.perf_counter() - started
+        return value, end
+    
+    def _iter_files(self) -> Iterator[Tuple[str, str]]:
+        text = self.source_code
+        if not text.startswith("{"):
+            # 单文件合约
+            yield self.main_file, text
+            return
+        
+        # {{...}} 从第二个字符开始解析，不复制字符串
+        start, end = (1, len(text) - 1) if text.startswith("{{") else (0, len(text))
+        state = {"sources": False, "settings": {}}
+        
+        def source_member(file_path, pos):
+            file_data, pos = self._decode(pos)
+            if not isinstance(file_data, dict):
+                raise json.JSONDecodeError("Expecting source object", text, pos)
+            yield file_path.lstrip("/"), file_data.get("content", "")
+            return pos
+        
+        def top_member(key, pos):
+            if key == "sources" and text[pos] == "{":
+                state["sources"] = True
+                yield from self._iter_members(pos, source_member)
+                return self._end
+            value, pos = self._decode(pos)
+            if key == "settings":
+                state["settings"] = value
+            return pos
+        
+        try:
+            yield from self._iter_members(self._skip(start), top_member)
+            if self._skip(self._end) != end:
+                raise json.JSONDecodeError("Extra data", text, self._end)
+        except (json.JSONDecodeError, IndexError):
+            # 不是 JSON 格式，当作普通源代码处理，已返回的部分文件作废
+            if self.paths:
+                self.discarded, self.paths = self.paths, []
+            yield self._fallback()
+            return
+        
+        if state["sources"]:
+            self.standard_json = True
+            self.settings = state["settings"]
+        else:
+            # 其他格式，直接保存
+            yield self._fallback()
+
+
+def parse_source_code(source_code: str, contract_name: str) -> Tuple[Dict[str, str], Optional[Dict]]:
+    """将 API 返回的 SourceCode 解析为 ({相对路径: 内容}, 编译器设置)
+    
+    标准 JSON 输入格式返回其中的 sources 和 settings；单文件或无法解析的内容
+    保存为 <合约名>.sol，此时编译器设置为 None。需要逐个写入文件时使用 SourceFileStream。
+    """
+    stream = SourceFileStream(source_code, contract_name)
+    files = dict(stream.items())
+    if not stream.standard_json:
+        return dict([stream._fallback()]), None
+    return files, stream.settings
+
+
+def timed_parse_source_code(source_code: str, contract_name: str) -> Tuple[Tuple[Dict[str, str], Optional[Dict]], float]:
+    """在解析进程中执行 parse_source_code，同时返回解析耗时 (秒)"""
+    start = time.perf_counter()
+    parsed = parse_source_code(source_code, contract_name)
+    return parsed, time.perf_counter() - start
+
+
 class ContractDownloader:
     """智能合约下载器类"""
     
-    def __init__(self):
+    def __init__(self, cache_enabled: Optional[bool] = None, cache_dir: Optional[str] = None):
+        """cache_enabled / cache_dir 为命令行的缓存选项，优先于环境变量，在打开响应缓存之前生效
+        (关闭缓存时不会创建缓存目录和数据库)"""
         # 支持 Etherscan V2 统一 API
         self.use_v2_api = os.getenv("USE_ETHERSCAN_V2", "true").lower() == "true"
         
@@ -100,31 +2250,296 @@ class ContractDownloader:
         # 从环境变量获取配置
         self.download_delay = float(os.getenv("DOWNLOAD_DELAY", "1"))
         self.verbose = os.getenv("VERBOSE", "true").lower() == "true"
+        self.concurrency = max(1, int(os.getenv("CONCURRENCY", "1")))
+        
+        # 令牌桶限速: 未配置 RATE_LIMIT 时按 DOWNLOAD_DELAY 换算 (兼容旧配置)
+        rate_limit = os.getenv("RATE_LIMIT")
+        if rate_limit:
+            self.rate_limit = float(rate_limit)
+        else:
+            self.rate_limit = 1 / self.download_delay if self.download_delay > 0 else 0
+        self.rate_limit_burst = int(os.getenv("RATE_LIMIT_BURST", str(max(1, int(self.rate_limit)))))
+        self.rate_limit_retries = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5"))
+        
+        # 可重试错误 (超时、连接错误、5xx、无效 JSON) 的指数退避重试，以及按链的熔断器
+        self.max_retries = int(os.getenv("MAX_RETRIES", "3"))
+        self.retry_backoff_base = float(os.getenv("RETRY_BACKOFF_BASE", "1"))
+        self.retry_backoff_max = float(os.getenv("RETRY_BACKOFF_MAX", "30"))
+        self.circuit_failure_threshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+        self.circuit_reset_timeout = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+        self.circuit_max_deferrals = int(os.getenv("CIRCUIT_MAX_DEFERRALS", "10"))
+        self.circuit_breakers: Dict[str, CircuitBreaker] = {}
+        self.circuit_breakers_lock = threading.Lock()
+        
+        # 相同 (链, 地址) 的并发请求合并为一次 (getsourcecode 的结果与区块 tag 无关)
+        self.single_flight = SingleFlight()
+        
+        # API 密钥池: 每个密钥独立限速，按密钥环境变量名分组 (V2 只有一个)
+        self.api_key_cooldown = float(os.getenv("API_KEY_COOLDOWN", "3600"))
+        self.key_pools: Dict[str, ApiKeyPool] = {}
+        self.key_pools_lock = threading.Lock()
+        
+        # 运行指标 (计数器和直方图)，可导出为 JSON 报告或 Prometheus 文本格式
+        self.metrics = Metrics()
+        self.metrics_json = None
+        self.metrics_prom = None
+        self.profiler = None
+        
+        # 共享 HTTP 连接池 (keep-alive)
+        self.http = HttpClient(
+            pool_size=int(os.getenv("HTTP_POOL_SIZE", str(max(10, self.concurrency)))),
+            connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+            read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "30")),
+            http2=os.getenv("HTTP2", "false").lower() == "true",
+            metrics=self.metrics
+        )
+        
+        # 响应缓存: 已验证的源代码几乎不会变化，重复请求直接读本地；
+        # 未验证、源代码为空的地址记录在负缓存中，过期前不再请求 (recheck_missing 为 True 时忽略负缓存)
+        self.recheck_missing = False
+        self.cache = None
+        if cache_enabled is None:
+            cache_enabled = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+        self.configure_cache(
+            enabled=cache_enabled,
+            cache_dir=cache_dir or os.getenv("CACHE_DIR", ".contract_cache"),
+            ttl=float(os.getenv("CACHE_TTL", "0"))
+        )
         
         # 创建输出目录
         output_dir_name = os.getenv("OUTPUT_DIR", "contracts")
         self.output_dir = Path(output_dir_name)
         self.output_dir.mkdir(exist_ok=True)
+        
+        # 内容寻址的源文件存储 (可选)，相同的库文件只保存一份
+        self.source_store = None
+        
+        # 输出后端: directory (默认目录结构) 或 sqlite (单文件数据库)
+        # fsync 策略: none / contract / batch，未设置时使用各后端的默认值
+        self.fsync_policy = os.getenv("FSYNC_POLICY") or None
+        self.file_write_workers = int(os.getenv("FILE_WRITE_WORKERS", "4"))
+        # 源文件压缩: none / gzip / zstd，file (逐个文件) 或 bundle (每个合约一个压缩包)
+        self.compression = resolve_compression(os.getenv("COMPRESSION"))
+        self.compression_mode = os.getenv("COMPRESSION_MODE", "file").lower()
+        self.compression_level = int(os.getenv("COMPRESSION_LEVEL")) if os.getenv("COMPRESSION_LEVEL") else None
+        self.backend = None
+        self.configure_backend(os.getenv("OUTPUT_BACKEND", "directory"), os.getenv("OUTPUT_DB"))
+        
+        if os.getenv("DEDUP_STORE", "false").lower() == "true":
+            self.configure_source_store()
+        
+        # 元数据索引，支持 query 子命令快速查询
+        self.metadata_index = None
+        if os.getenv("METADATA_INDEX", "true").lower() == "true":
+            self.metadata_index = MetadataIndex(Path(os.getenv("INDEX_DB") or self.output_dir / "index.sqlite"))
+        
+        # 代理合约实现追踪
+        self.follow_proxies = os.getenv("FOLLOW_PROXIES", "false").lower() == "true"
+        self.proxy_max_depth = int(os.getenv("PROXY_MAX_DEPTH", "3"))
+        
+        # 批量下载流水线: 获取 -> 解析 -> 写入，大体积的 SourceCode 交给进程池解析
+        self.parse_workers = int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.parse_process_threshold = int(float(os.getenv("PARSE_PROCESS_THRESHOLD_KB", "512")) * 1024)
+        # 超过该大小的源代码不交给进程池 (需要完整解析并跨进程复制)，在写入线程中逐个文件解码写入
+        self.stream_parse_threshold = int(float(os.getenv("STREAM_PARSE_THRESHOLD_KB", "4096")) * 1024)
+        self.persist_workers = max(1, int(os.getenv("PERSIST_WORKERS", "4")))
+        self.pipeline_queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", "0"))
+        self.pipeline_max_bytes = int(float(os.getenv("PIPELINE_MAX_MB", "256")) * 1024 * 1024)
+        
+        # 批量下载检查点日志 (位于输出目录中)
+        self.journal_name = ".batch_journal.jsonl"
+        
+        # 多链公平调度: fifo (按输入顺序)、round-robin 或 weighted (CHAIN_WEIGHTS)
+        self.scheduler_policy = "round-robin"
+        self.scheduler_lookahead = 10000
+        self.chain_weights: Dict[str, float] = {}
+        
+        # 链名称映射到ID (批量下载使用)
+        self.chain_name_to_id = dict(CHAIN_NAME_TO_ID)
+        
+        self.configure_scheduler(os.getenv("SCHEDULER"), os.getenv("CHAIN_WEIGHTS"),
+                                 int(os.getenv("SCHEDULER_LOOKAHEAD")) if os.getenv("SCHEDULER_LOOKAHEAD") else None)
+        
+        self.configure_metrics(os.getenv("METRICS_JSON"), os.getenv("METRICS_PROM_FILE"), float(os.getenv("METRICS_INTERVAL", "15")))
+    
+    def configure_scheduler(self, policy: Optional[str] = None, weights: Optional[str] = None, lookahead: Optional[int] = None):
+        """配置批量下载的多链调度 (命令行参数优先于环境变量)
+        
+        weights 形如 "bsc=2,eth=1" (链名称或链ID)，只在 weighted 策略下生效；设置权重且未指定策略时使用 weighted。
+        """
+        if weights:
+            chain_weights = {}
+            for item in weights.split(","):
+                if not item.strip():
+                    continue
+                chain, _, weight = item.partition("=")
+                chain = chain.strip()
+                chain_weights[self.chain_name_to_id.get(chain.lower(), chain)] = float(weight)
+            self.chain_weights = chain_weights
+            if policy is None:
+                policy = "weighted"
+        if policy is not None:
+            policy = policy.lower()
+            if policy not in FairScheduler.POLICIES:
+                raise ValueError(f"不支持的调度策略 '{policy}'，支持: {', '.join(FairScheduler.POLICIES)}")
+            self.scheduler_policy = policy
+        if lookahead is not None:
+            self.scheduler_lookahead = max(1, lookahead)
+    
+    def batch_chain_key(self, contract: Dict) -> str:
+        """批量条目所属的链 (调度队列的键)"""
+        chain = str(contract.get('chain', ''))
+        return self.chain_name_to_id.get(chain.lower(), chain)
+    
+    def chain_available(self, chain_id: str) -> bool:
+        """链当前是否可以请求 (熔断器未打开)"""
+        breaker = self.circuit_breakers.get(chain_id)
+        return breaker is None or breaker.state != "open"
+    
+    def configure_rate_limit(self, rate: Optional[float] = None, burst: Optional[int] = None):
+        """覆盖限速配置 (命令行参数优先于环境变量)"""
+        if rate is not None:
+            self.rate_limit = rate
+            if burst is None:
+                self.rate_limit_burst = max(1, int(rate))
+        if burst is not None:
+            self.rate_limit_burst = burst
+        with self.key_pools_lock:
+            self.key_pools = {}
+    
+    def configure_cache(self, enabled: bool = True, cache_dir: Optional[str] = None, ttl: Optional[float] = None, negative_ttl: Optional[float] = None):
+        """启用/关闭响应缓存 (命令行参数优先于环境变量)"""
+        if self.cache is not None:
+            cache_dir = cache_dir or str(self.cache.cache_dir)
+            ttl = self.cache.ttl if ttl is None else ttl
+            negative_ttl = self.cache.negative_ttl if negative_ttl is None else negative_ttl
+            self.cache.close()
+            self.cache = None
+        
+        if enabled:
+            max_bytes = int(float(os.getenv("CACHE_MAX_SIZE_MB", "1024")) * 1024 * 1024)
+            if negative_ttl is None:
+                negative_ttl = float(os.getenv("NEGATIVE_CACHE_TTL", "86400"))
+            self.cache = ResponseCache(Path(cache_dir or ".contract_cache"), max_bytes=max_bytes, ttl=ttl or 0, negative_ttl=negative_ttl)
+    
+    def configure_source_store(self, store_dir: Optional[str] = None):
+        """启用内容寻址的源文件存储 (默认位于输出目录下的 .blobs，仅用于目录后端)"""
+        store_dir = store_dir or os.getenv("DEDUP_STORE_DIR") or str(self.output_dir / ".blobs")
+        self.source_store = SourceStore(Path(store_dir))
+        if isinstance(self.backend, DirectoryBackend):
+            self.backend.source_store = self.source_store
+    
+    def configure_backend(self, backend: str = "directory", db_path: Optional[str] = None):
+        """选择输出后端 (directory / sqlite)"""
+        if self.backend is not None:
+            self.backend.close()
+        
+        backend = backend.lower()
+        if backend == "sqlite":
+            db_path = Path(db_path) if db_path else self.output_dir / "contracts.sqlite"
+            self.backend = SQLiteBackend(db_path, batch_size=int(os.getenv("SQLITE_BATCH_SIZE", "100")),
+                                         fsync_policy=self.fsync_policy,
+                                         compression=self.compression, compression_level=self.compression_level)
+        elif backend == "directory":
+            self.backend = DirectoryBackend(self.output_dir, self.source_store,
+                                            fsync_policy=self.fsync_policy, write_workers=self.file_write_workers,
+                                            compression=self.compression, compression_mode=self.compression_mode,
+                                            compression_level=self.compression_level)
+        else:
+            raise ValueError(f"不支持的输出后端 '{backend}'，支持: directory, sqlite")
+    
+    def configure_metrics(self, json_path: Optional[str] = None, prom_path: Optional[str] = None, interval: float = 15):
+        """配置指标导出: 结束时写入 JSON 报告；Prometheus 文本文件每 interval 秒更新一次"""
+        if json_path:
+            self.metrics_json = Path(json_path)
+        if prom_path:
+            self.metrics_prom = Path(prom_path)
+            self.metrics.start_exporter(self.metrics_prom, interval)
+    
+    def start_profile(self):
+        """开始 cProfile 性能剖析，批量下载的工作线程同样被记录"""
+        self.profiler = RunProfiler()
+        self.profiler.start()
+    
+    def stop_profile(self, path):
+        """停止性能剖析并保存结果"""
+        if self.profiler is None:
+            return
+        self.profiler.dump(path)
+        self.profiler = None
+        print(f"性能剖析已保存: {path} (查看: python -m pstats {path})")
+    
+    def _thread_initializer(self):
+        if self.profiler is not None:
+            self.profiler.thread_initializer()
+    
+    def flush_metrics(self):
+        """写入指标文件 (JSON 报告和 Prometheus 文本文件)"""
+        self.metrics.stop_exporter()
+        try:
+            if self.metrics_prom is not None:
+                self.metrics.write_prometheus(self.metrics_prom)
+            if self.metrics_json is not None:
+                self.metrics.write_json(self.metrics_json)
+                print(f"指标报告已保存: {self.metrics_json}")
+        except OSError as e:
+            print(f"警告: 写入指标文件失败: {e}")
+    
+    def close(self):
+        """释放连接池、缓存、输出后端等资源，并写入指标文件"""
+        self.flush_metrics()
+        self.http.close()
+        self.backend.close()
+        if self.metadata_index is not None:
+            self.metadata_index.close()
+        if self.cache is not None:
+            self.cache.close()
     
     def get_api_key(self, chain_id: str) -> Optional[str]:
-        """获取对应链的API密钥"""
+        """获取对应链的API密钥 (配置了多个密钥时返回第一个)"""
+        api_keys = self.get_api_keys(chain_id)
+        return api_keys[0] if api_keys else None
+    
+    def get_api_keys(self, chain_id: str) -> List[str]:
+        """获取对应链的全部API密钥
+        
+        密钥环境变量可以用逗号分隔多个密钥；V2 模式下还会读取 ETHERSCAN_API_KEYS。
+        """
         if chain_id not in self.chain_configs:
-            return None
+            return []
         
         if self.use_v2_api:
             # V2 API 使用统一的 API 密钥
-            api_key = os.getenv(self.api_key_env)
-            if not api_key and self.verbose:
+            env_var = self.api_key_env
+            raw_keys = ",".join(filter(None, [os.getenv(env_var), os.getenv(f"{env_var}S")]))
+            if not raw_keys and self.verbose:
                 print(f"警告: 未找到 {self.api_key_env} 环境变量")
                 print("建议配置 Etherscan V2 API 密钥以访问 50+ 条链")
         else:
             # V1 API 使用链特定的 API 密钥
             env_var = self.chain_configs[chain_id]["api_key_env"]
-            api_key = os.getenv(env_var)
-            if not api_key and self.verbose:
+            raw_keys = os.getenv(env_var, "")
+            if not raw_keys and self.verbose:
                 print(f"警告: 未找到 {env_var} 环境变量，将使用无API密钥模式（可能受到速率限制）")
         
-        return api_key
+        api_keys = []
+        for key in raw_keys.split(","):
+            key = key.strip()
+            if key and key not in api_keys:
+                api_keys.append(key)
+        return api_keys
+    
+    def get_key_pool(self, chain_id: str) -> ApiKeyPool:
+        """获取对应链的 API 密钥池 (同一密钥环境变量的链共享一个池)"""
+        env_var = self.api_key_env if self.use_v2_api else self.chain_configs[chain_id]["api_key_env"]
+        with self.key_pools_lock:
+            pool = self.key_pools.get(env_var)
+            if pool is None:
+                pool = ApiKeyPool(self.get_api_keys(chain_id), self.rate_limit, self.rate_limit_burst, self.api_key_cooldown)
+                self.key_pools[env_var] = pool
+                if len(pool.keys) > 1:
+                    print(f"API 密钥池: {env_var} 共 {len(pool.keys)} 个密钥，每个密钥限速 {self.rate_limit:g} 次/秒")
+            return pool
     
     def is_valid_address(self, address: str) -> bool:
         """验证以太坊地址格式"""
@@ -138,8 +2553,63 @@ class ContractDownloader:
         except ValueError:
             return False
     
-    def get_contract_source(self, chain_id: str, contract_address: str, block_number: Optional[str] = None) -> Optional[Dict]:
-        """从区块链浏览器API获取合约源代码"""
+    def get_circuit_breaker(self, chain_id: str) -> CircuitBreaker:
+        """获取链的熔断器"""
+        with self.circuit_breakers_lock:
+            breaker = self.circuit_breakers.get(chain_id)
+            if breaker is None:
+                breaker = CircuitBreaker(self.circuit_failure_threshold, self.circuit_reset_timeout)
+                self.circuit_breakers[chain_id] = breaker
+            return breaker
+    
+    @staticmethod
+    def is_retryable_error(error: Exception) -> bool:
+        """判断请求错误是否可重试: 超时、连接错误、429/5xx 和无效 JSON (如网关错误页) 可重试"""
+        if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError, json.JSONDecodeError)):
+            return True
+        if isinstance(error, requests.exceptions.HTTPError):
+            response = getattr(error, "response", None)
+            status_code = response.status_code if response is not None else getattr(error, "status_code", None)
+            return status_code is None or status_code == 429 or status_code >= 500
+        return False
+    
+    def retry_delay(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间: 指数退避 + 全抖动"""
+        return random.uniform(0, min(self.retry_backoff_max, self.retry_backoff_base * (2 ** (attempt - 1))))
+    
+    def get_contract_source(self, chain_id: str, contract_address: str, block_number: Optional[str] = None, retry_rate_limit: bool = True) -> Optional[Dict]:
+        """从区块链浏览器API获取合约源代码
+        
+        遇到速率限制或链熔断时，retry_rate_limit 为 True 则等待后原地重试，
+        为 False 则抛出 RetryLaterError，由调用方 (如批量下载队列) 重新排队。
+        """
+        attempts = 0
+        key = (str(chain_id), contract_address.lower())
+        while True:
+            try:
+                contract_data, shared = self.single_flight.do(key, lambda: self._fetch_contract_source(chain_id, contract_address, block_number))
+                if shared:
+                    self.metrics.inc("coalesced_requests_total", scope="thread")
+                    print(f"合并请求: {contract_address} 使用同时进行的相同请求的结果")
+                return contract_data
+            except RetryLaterError as e:
+                if not retry_rate_limit:
+                    raise
+                attempts += 1
+                max_attempts = self.rate_limit_retries if isinstance(e, RateLimitError) else self.circuit_max_deferrals
+                if attempts > max_attempts:
+                    print(f"API错误: 多次重试后放弃 ({e})")
+                    return None
+                print(f"暂时无法请求: {e}，等待后重试 ({attempts}/{max_attempts})")
+                if e.retry_after > 0:
+                    time.sleep(e.retry_after)
+    
+    def _fetch_contract_source(self, chain_id: str, contract_address: str, block_number: Optional[str] = None) -> Optional[Dict]:
+        """执行 getsourcecode 请求
+        
+        可重试错误按指数退避重试 MAX_RETRIES 次；速率限制回复抛出 RateLimitError，
+        链熔断时抛出 CircuitOpenError。
+        """
         if chain_id not in self.chain_configs:
             print(f"错误: 不支持的链ID {chain_id}")
             print(f"支持的链ID: {', '.join(self.chain_configs.keys())}")
@@ -150,7 +2620,26 @@ class ContractDownloader:
             return None
         
         config = self.chain_configs[chain_id]
-        api_key = self.get_api_key(chain_id)
+        
+        if self.cache is not None:
+            contract_data = self.cache.get(chain_id, contract_address, block_number)
+            if contract_data is not None:
+                self.metrics.inc("cache_hits_total", chain=chain_id)
+                print(f"缓存命中: {config['name']} {contract_address}")
+                return contract_data
+            self.metrics.inc("cache_misses_total", chain=chain_id)
+            
+            if not self.recheck_missing:
+                negative = self.cache.get_negative(chain_id, contract_address, block_number)
+                if negative is not None:
+                    self.metrics.inc("negative_cache_hits_total", chain=chain_id, reason=negative["reason"])
+                    reason = ResponseCache.NEGATIVE_REASONS.get(negative["reason"], negative["reason"])
+                    expires_in = (negative["expires_at"] - time.time()) / 3600
+                    print(f"跳过: {config['name']} {contract_address} 已知{reason}，{expires_in:.1f} 小时后重新检查")
+                    return None
+        
+        key_pool = self.get_key_pool(chain_id)
+        breaker = self.get_circuit_breaker(chain_id)
         
         # 构建API请求参数
         params = {
@@ -167,9 +2656,6 @@ class ContractDownloader:
             # V1 API 使用链特定的 URL
             api_url = config["api_url"]
         
-        if api_key:
-            params["apikey"] = api_key
-        
         if block_number:
             params["tag"] = block_number
         
@@ -180,28 +2666,93 @@ class ContractDownloader:
             if block_number:
                 print(f"区块号: {block_number}")
             
-            response = requests.get(api_url, params=params, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
+            attempt = 0
+            while True:
+                try:
+                    probe = breaker.check(config['name'])
+                except CircuitOpenError:
+                    self.metrics.inc("circuit_rejections_total", chain=chain_id)
+                    raise
+                try:
+                    wait_started = time.perf_counter()
+                    api_key = key_pool.acquire()
+                    self.metrics.observe("rate_limit_wait_seconds", time.perf_counter() - wait_started, chain=chain_id)
+                    if api_key:
+                        params["apikey"] = api_key
+                    
+                    request_started = time.perf_counter()
+                    try:
+                        response = self.http.get(api_url, params=params)
+                        response.raise_for_status()
+                        # 直接从响应字节解析，随后释放响应体，只保留解析后的数据
+                        data = json.loads(response.content)
+                        response = None
+                    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+                        self.metrics.observe("api_request_seconds", time.perf_counter() - request_started, chain=chain_id)
+                        self.metrics.inc("api_requests_total", chain=chain_id, result="error")
+                        if not self.is_retryable_error(e):
+                            if isinstance(e, requests.exceptions.HTTPError):
+                                # 收到了 4xx 等不可重试的 HTTP 回复，说明链本身可达
+                                breaker.record_success()
+                                probe = False
+                            raise
+                        breaker.record_failure()
+                        probe = False
+                        attempt += 1
+                        if attempt > self.max_retries:
+                            print(f"网络请求错误: {e} (已重试 {self.max_retries} 次)")
+                            return None
+                        delay = self.retry_delay(attempt)
+                        self.metrics.inc("retries_total", chain=chain_id, reason=type(e).__name__)
+                        self.metrics.observe("retry_backoff_seconds", delay, chain=chain_id)
+                        print(f"请求失败: {e}，{delay:.1f} 秒后重试 ({attempt}/{self.max_retries})")
+                        time.sleep(delay)
+                        continue
+                    
+                    self.metrics.observe("api_request_seconds", time.perf_counter() - request_started, chain=chain_id)
+                    breaker.record_success()
+                    probe = False
+                    break
+                finally:
+                    if probe:
+                        # 探测请求在得到结果前退出 (如所有密钥都在冷却)，释放探测名额
+                        breaker.release_probe()
             
             if data.get("status") != "1":
+                message = str(data.get("result", "")).lower()
+                if "rate limit" in message:
+                    self.metrics.inc("api_requests_total", chain=chain_id, result="rate_limited")
+                    key_pool.on_rate_limited(api_key, daily="daily" in message)
+                    raise RateLimitError(data.get("result"))
+                self.metrics.inc("api_requests_total", chain=chain_id, result="api_error")
+                key_pool.on_success(api_key)
+                if "not verified" in message:
+                    self.remember_missing(chain_id, contract_address, block_number, "not_verified", str(data.get("result", "")))
                 print(f"API错误: {data.get('message', '未知错误')}")
                 return None
             
+            self.metrics.inc("api_requests_total", chain=chain_id, result="ok")
+            key_pool.on_success(api_key)
             result = data.get("result", [])
             if not result or not result[0]:
+                self.remember_missing(chain_id, contract_address, block_number, "not_found")
                 print("错误: 未找到合约源代码或合约未验证")
                 return None
             
             contract_data = result[0]
             
             if not contract_data.get("SourceCode"):
+                self.remember_missing(chain_id, contract_address, block_number, "empty_source", str(contract_data.get("ABI", ""))[:200])
                 print("错误: 合约源代码为空或未验证")
                 return None
             
+            if self.cache is not None:
+                self.cache.put(chain_id, contract_address, block_number, contract_data)
+            
             return contract_data
             
+        except RetryLaterError:
+            raise
         except requests.exceptions.RequestException as e:
             print(f"网络请求错误: {e}")
             return None
@@ -212,77 +2763,38 @@ class ContractDownloader:
             print(f"未知错误: {e}")
             return None
     
-    def save_contract_files(self, chain_id: str, contract_address: str, contract_data: Dict, block_number: Optional[str] = None, custom_name: Optional[str] = None) -> bool:
-        """保存合约文件到本地"""
-        try:
-            chain_name = self.chain_configs[chain_id]["name"]
-            contract_name = contract_data.get("ContractName", "Unknown")
-            
-            # 创建目录结构
-            if custom_name:
-                # 使用自定义名称作为目录名
-                dir_name = custom_name
-            else:
-                # 使用原来的命名方式
-                if block_number:
-                    dir_name = f"{chain_name}_{contract_address}_{block_number}"
-                else:
-                    dir_name = f"{chain_name}_{contract_address}"
-            
-            contract_dir = self.output_dir / dir_name
-            contract_dir.mkdir(exist_ok=True)
-            
-            source_code = contract_data.get("SourceCode", "")
-            
-            # 处理多文件合约（Proxy合约等）
-            if source_code.startswith("{"):
-                try:
-                    # 尝试解析JSON格式的多文件源代码
-                    if source_code.startswith("{{"):
-                        source_code = source_code[1:-1]  # 移除外层大括号
-                    
-                    source_json = json.loads(source_code)
-                    
-                    if "sources" in source_json:
-                        # 标准格式
-                        sources = source_json["sources"]
-                        settings = source_json.get("settings", {})
-                        
-                        # 保存设置文件
-                        with open(contract_dir / "compiler_settings.json", "w", encoding="utf-8") as f:
-                            json.dump(settings, f, indent=2, ensure_ascii=False)
-                        
-                        # 保存每个源文件
-                        for file_path, file_data in sources.items():
-                            content = file_data.get("content", "")
-                            
-                            # 创建文件路径
-                            file_full_path = contract_dir / file_path.lstrip("/")
-                            file_full_path.parent.mkdir(parents=True, exist_ok=True)
-                            
-                            with open(file_full_path, "w", encoding="utf-8") as f:
-                                f.write(content)
-                            
-                            print(f"已保存: {file_full_path}")
-                    else:
-                        # 其他格式，尝试直接处理
-                        main_file = contract_dir / f"{contract_name}.sol"
-                        with open(main_file, "w", encoding="utf-8") as f:
-                            f.write(source_code)
-                        print(f"已保存: {main_file}")
-                        
-                except json.JSONDecodeError:
-                    # 如果不是JSON格式，当作普通源代码处理
-                    main_file = contract_dir / f"{contract_name}.sol"
-                    with open(main_file, "w", encoding="utf-8") as f:
-                        f.write(source_code)
-                    print(f"已保存: {main_file}")
+    def remember_missing(self, chain_id: str, contract_address: str, block_number: Optional[str], reason: str, message: str = ""):
+        """将确定没有源代码的地址写入负缓存"""
+        if self.cache is not None:
+            self.cache.put_negative(chain_id, contract_address, block_number, reason, message)
+    
+    def contract_dir_name(self, chain_id: str, contract_address: str, block_number: Optional[str] = None, custom_name: Optional[str] = None) -> str:
+        """合约在输出后端中的名称 (目录名)"""
+        if custom_name:
+            # 使用自定义名称作为目录名
+            return custom_name
+        
+        # 使用原来的命名方式
+        chain_name = self.chain_configs[chain_id]["name"]
+        if block_number:
+            return f"{chain_name}_{contract_address}_{block_number}"
+        return f"{chain_name}_{contract_address}"
+    
+    def save_contract_files(self, chain_id: str, contract_address: str, contract_data: Dict, block_number: Optional[str] = None, custom_name: Optional[str] = None, parsed: Optional[Tuple[Dict[str, str], Optional[Dict]]] = None) -> bool:
+        """保存合约文件到输出后端
+        
+        parsed 为已解析的 (文件, 编译器设置)，批量流水线在进程池中解析后传入；
+        为 None 时逐个解码并写入源文件 (SourceFileStream)，不在内存中保留整个文件集合。
+        """
+        try:
+            chain_name = self.chain_configs[chain_id]["name"]
+            contract_name = contract_data.get("ContractName", "Unknown")
+            dir_name = self.contract_dir_name(chain_id, contract_address, block_number, custom_name)
+            
+            if parsed is None:
+                files, settings = SourceFileStream(contract_data.get("SourceCode", ""), contract_name), None
             else:
-                # 单文件合约
-                main_file = contract_dir / f"{contract_name}.sol"
-                with open(main_file, "w", encoding="utf-8") as f:
-                    f.write(source_code)
-                print(f"已保存: {main_file}")
+                files, settings = parsed
             
             # 保存合约元数据
             metadata = {
@@ -298,17 +2810,35 @@ class ContractDownloader:
                 "license_type": contract_data.get("LicenseType", ""),
                 "proxy": contract_data.get("Proxy", ""),
                 "implementation": contract_data.get("Implementation", ""),
-                "swarm_source": contract_data.get("SwarmSource", "")
+                "swarm_source": contract_data.get("SwarmSource", ""),
+                "downloaded_at": time.strftime(TIMESTAMP_FORMAT, time.gmtime())
             }
             
             if block_number:
                 metadata["block_number"] = block_number
             
-            with open(contract_dir / "metadata.json", "w", encoding="utf-8") as f:
-                json.dump(metadata, f, indent=2, ensure_ascii=False)
+            write_started = time.perf_counter()
+            self.backend.write_contract(dir_name, files, settings, metadata)
+            if self.metadata_index is not None:
+                try:
+                    self.metadata_index.add(dir_name, metadata, self.backend.describe(dir_name))
+                except sqlite3.Error as e:
+                    # 合约文件已保存，索引可以之后用 query --reindex 重建，不算作保存失败
+                    self.metrics.inc("index_errors_total")
+                    print(f"警告: 写入元数据索引失败: {e} (可用 query --reindex 重建索引)")
+            write_seconds = time.perf_counter() - write_started
+            if isinstance(files, SourceFileStream):
+                # 逐个解码时解析和写入交替进行，分别统计
+                self.metrics.observe("parse_seconds", files.decode_seconds, worker="stream")
+                write_seconds -= files.decode_seconds
+                files = files.paths
+            self.metrics.observe("write_seconds", write_seconds, backend=self.backend.name)
+            self.metrics.inc("files_written_total", len(files), backend=self.backend.name)
             
-            print(f"已保存元数据: {contract_dir / 'metadata.json'}")
-            print(f"合约文件已成功下载到: {contract_dir}")
+            for file_path in files:
+                print(f"已保存: {self.backend.describe(dir_name, file_path)}")
+            print(f"已保存元数据: {self.backend.describe(dir_name, 'metadata.json')}")
+            print(f"合约文件已成功下载到: {self.backend.describe(dir_name)}")
             
             return True
             
@@ -316,17 +2846,21 @@ class ContractDownloader:
             print(f"保存文件时出错: {e}")
             return False
     
-    def download_contract(self, chain_id: str, contract_address: str, block_number: Optional[str] = None, show_header: bool = True, custom_name: Optional[str] = None) -> bool:
+    def download_contract(self, chain_id: str, contract_address: str, block_number: Optional[str] = None, show_header: bool = True, custom_name: Optional[str] = None, retry_rate_limit: bool = True) -> bool:
         """下载合约的主要方法"""
+        return self._download_contract(chain_id, contract_address, block_number, show_header, custom_name, retry_rate_limit) is not None
+    
+    def _download_contract(self, chain_id: str, contract_address: str, block_number: Optional[str] = None, show_header: bool = True, custom_name: Optional[str] = None, retry_rate_limit: bool = True) -> Optional[Dict]:
+        """下载并保存合约，成功时返回 API 返回的合约数据，失败返回 None"""
         if show_header:
             print("=" * 60)
             print("智能合约源代码下载器")
             print("=" * 60)
         
         # 获取合约源代码
-        contract_data = self.get_contract_source(chain_id, contract_address, block_number)
+        contract_data = self.get_contract_source(chain_id, contract_address, block_number, retry_rate_limit)
         if not contract_data:
-            return False
+            return None
         
         # 显示合约信息
         print(f"\n合约信息:")
@@ -340,20 +2874,142 @@ class ContractDownloader:
         
         if success:
             print(f"\n✅ 合约下载完成!")
-            return True
+            return contract_data
         else:
             print(f"\n❌ 合约下载失败!")
-            return False
+            return None
+    
+    def _batch_task(self, i, contract: Dict) -> Dict:
+        """由批量任务条目生成任务信息 (名称、链ID、地址、区块号)"""
+        name = contract.get('name', f'Contract_{i}')
+        chain = str(contract.get('chain', ''))
+        address = contract.get('address', '')
+        
+        # 处理区块号 (height 或 block)
+        block_number = contract.get('height') or contract.get('block')
+        if block_number:
+            block_number = str(block_number)
+        
+        # 转换链名称为ID
+        chain_id = self.chain_name_to_id.get(chain.lower(), chain)
+        
+        # 实现合约条目的名称 (contract_dir_name) 已包含地址，直接作为结果标识
+        key = name if contract.get('_proxy_of') else f"{name}_{address}"
+        return {"key": key, "name": name, "chain": chain, "chain_id": chain_id, "address": address, "block_number": block_number, "contract_data": None}
+    
+    def sync_status(self, task: Dict, max_age: float = 0) -> str:
+        """同步模式下批量条目已有输出的状态
+        
+        Returns:
+            str: fresh (完整且未过期，可跳过)、missing (不存在)、changed (目录中是其他地址或区块的合约)、
+                 incomplete (缺少源文件) 或 stale (下载时间早于 max_age 秒前，或没有下载时间)
+        """
+        metadata = self.backend.read_metadata(task["name"])
+        if metadata is None:
+            return "missing"
+        if (str(metadata.get("contract_address", "")).lower() != task["address"].lower()
+                or str(metadata.get("chain_id", "")) != task["chain_id"]
+                or metadata.get("block_number") != task["block_number"]):
+            return "changed"
+        if not self.backend.list_files(task["name"]):
+            return "incomplete"
+        if max_age > 0:
+            try:
+                downloaded_at = calendar.timegm(time.strptime(metadata["downloaded_at"], TIMESTAMP_FORMAT))
+            except (KeyError, TypeError, ValueError):
+                return "stale"
+            if time.time() - downloaded_at > max_age:
+                return "stale"
+        return "fresh"
+    
+    def batch_lookup_key(self, contract: Dict) -> Optional[Tuple[str, str]]:
+        """批量条目对应的请求键 (链ID, 小写地址)，参数无效时返回 None (不参与合并)"""
+        chain = str(contract.get('chain', ''))
+        chain_id = self.chain_name_to_id.get(chain.lower(), chain)
+        address = contract.get('address', '')
+        if chain_id not in self.chain_configs or not self.is_valid_address(address):
+            return None
+        return chain_id, address.lower()
+    
+    def _fetch_batch_entry(self, i, total_contracts, contract: Dict) -> Dict:
+        """批量流水线的获取阶段: 校验参数并获取合约源代码
+        
+        触发 API 速率限制时抛出 RateLimitError，链熔断时抛出 CircuitOpenError，由批量队列重新排队。
+        
+        Returns:
+            Dict: 任务信息 (key, chain_id, address, block_number, name, contract_data)，失败时 contract_data 为 None
+        """
+        task = {"key": f"Contract_{i}_{contract.get('address', 'unknown')}", "contract_data": None}
+        try:
+            task = self._batch_task(i, contract)
+            name, chain, chain_id, address, block_number = task["name"], task["chain"], task["chain_id"], task["address"], task["block_number"]
+            
+            if contract.get('_proxy_of'):
+                print(f"\n[实现合约] 正在下载: {name} (代理: {', '.join(contract['_proxy_of'])})")
+            else:
+                print(f"\n[{i}/{total_contracts}] 正在下载: {name}")
+            print(f"  链: {chain} (ID: {chain_id})")
+            print(f"  地址: {address}")
+            if block_number:
+                print(f"  区块: {block_number}")
+            
+            # 验证必要参数
+            if not address:
+                print(f"❌ 错误: 合约地址为空")
+                return task
+            
+            if not chain_id or chain_id not in self.chain_configs:
+                print(f"❌ 错误: 不支持的链 '{chain}'")
+                return task
+            
+            # 获取合约源代码
+            contract_data = self.get_contract_source(chain_id, address, block_number, retry_rate_limit=False)
+            if contract_data:
+                print(f"\n{name} 合约信息:")
+                print(f"  名称: {contract_data.get('ContractName', 'Unknown')}")
+                print(f"  编译器版本: {contract_data.get('CompilerVersion', 'Unknown')}")
+                print(f"  优化: {contract_data.get('OptimizationUsed', 'Unknown')}")
+                print(f"  许可证: {contract_data.get('LicenseType', 'Unknown')}")
+            task["contract_data"] = contract_data
+            return task
+            
+        except RetryLaterError:
+            raise
+        except Exception as e:
+            print(f"❌ 处理合约时出错: {e}")
+            return task
+    
+    def _persist_batch_entry(self, task: Dict, parsed: Optional[Tuple[Dict[str, str], Optional[Dict]]] = None) -> Tuple[str, bool, Optional[Dict]]:
+        """批量流水线的写入阶段: 保存合约文件 (未在进程池中解析时在此解析)
+        
+        Returns:
+            Tuple: (结果键, 是否成功, 成功时的合约数据)
+        """
+        contract_data = task["contract_data"]
+        success = self.save_contract_files(task["chain_id"], task["address"], contract_data, task["block_number"], task["name"], parsed)
+        
+        if success:
+            print(f"\n✅ {task['name']} 合约下载完成!")
+            return task["key"], True, contract_data
+        else:
+            print(f"\n❌ {task['name']} 合约下载失败!")
+            return task["key"], False, None
     
-    def download_contracts_batch(self, contracts: List[Dict]) -> Dict[str, bool]:
+    def download_contracts_batch(self, contracts: Iterable[Dict], concurrency: Optional[int] = None, resume: bool = False, follow_proxies: Optional[bool] = None, proxy_depth: Optional[int] = None, sync: bool = False, max_age: Optional[float] = None) -> Dict[str, bool]:
         """批量下载合约
         
         Args:
-            contracts: 合约信息列表，每个元素包含:
+            contracts: 合约信息列表或迭代器 (可流式读取，见 iter_batch_file)，每个元素包含:
                 - name: 合约名称 (可选)
                 - chain: 链标识 (如 'bsc', 'eth', 'polygon' 或链ID)
                 - address: 合约地址
                 - height/block: 区块高度 (可选)
+            concurrency: 并发下载数 (可选，默认使用 CONCURRENCY 环境变量)
+            resume: 是否从输出目录中的检查点日志恢复，跳过已成功的合约
+            follow_proxies: 是否自动下载代理合约的实现合约 (默认使用 FOLLOW_PROXIES 环境变量)
+            proxy_depth: 追踪代理实现的最大层数 (默认使用 PROXY_MAX_DEPTH 环境变量)
+            sync: 同步模式，只下载输出中缺失、不完整或过期的合约，跳过的合约视为成功
+            max_age: 同步模式下已有输出的有效期 (秒，默认使用 SYNC_MAX_AGE 环境变量，0 表示永不过期)
         
         Returns:
             Dict: 下载结果，键为合约标识，值为是否成功
@@ -362,84 +3018,335 @@ class ContractDownloader:
         print("批量智能合约源代码下载器")
         print("=" * 60)
         
-        # 链名称映射到ID
-        chain_name_to_id = {
-            'eth': '1',
-            'ethereum': '1',
-            'bsc': '56',
-            'bnb': '56',
-            'polygon': '137',
-            'matic': '137',
-            'fantom': '250',
-            'ftm': '250',
-            'avalanche': '43114',
-            'avax': '43114',
-            'arbitrum': '42161',
-            'arb': '42161',
-            'optimism': '10',
-            'opt': '10'
-        }
+        concurrency = max(1, concurrency or self.concurrency)
+        self.http.ensure_pool_size(concurrency)
+        follow_proxies = self.follow_proxies if follow_proxies is None else follow_proxies
+        proxy_depth = self.proxy_max_depth if proxy_depth is None else proxy_depth
+        max_age = float(os.getenv("SYNC_MAX_AGE", "0")) if max_age is None else max_age
+        # 迭代器输入无法预知总数，进度显示为 [i/?]
+        total_contracts = len(contracts) if hasattr(contracts, "__len__") else "?"
         
-        results = {}
-        total_contracts = len(contracts)
+        # 结果按输入顺序写入 results；先完成的合约暂存在 pending_outcomes 中，
+        # 保证并发模式下的汇总与顺序模式一致，暂存量不超过在途请求数加调度器的预读窗口
+        results: Dict[str, bool] = {}
+        pending_outcomes: Dict[int, Tuple[str, bool]] = {}
+        next_index = 1
         successful_downloads = 0
+        processed_contracts = 0
         
-        print(f"准备下载 {total_contracts} 个合约...\n")
+        journal = BatchJournal(self.output_dir / self.journal_name, resume=resume)
+        self.backend.begin_batch()
+        if self.metadata_index is not None:
+            self.metadata_index.begin_batch()
         
-        for i, contract in enumerate(contracts, 1):
-            try:
-                # 提取合约信息
-                name = contract.get('name', f'Contract_{i}')
-                chain = str(contract.get('chain', ''))
-                address = contract.get('address', '')
-                
-                # 处理区块号 (height 或 block)
-                block_number = contract.get('height') or contract.get('block')
-                if block_number:
-                    block_number = str(block_number)
-                
-                # 转换链名称为ID
-                if chain.lower() in chain_name_to_id:
-                    chain_id = chain_name_to_id[chain.lower()]
-                else:
-                    chain_id = chain
-                
-                print(f"\n[{i}/{total_contracts}] 正在下载: {name}")
-                print(f"  链: {chain} (ID: {chain_id})")
-                print(f"  地址: {address}")
-                if block_number:
-                    print(f"  区块: {block_number}")
-                
-                # 验证必要参数
-                if not address:
-                    print(f"❌ 错误: 合约地址为空")
-                    results[f"{name}_{address}"] = False
-                    continue
-                
-                if not chain_id or chain_id not in self.chain_configs:
-                    print(f"❌ 错误: 不支持的链 '{chain}'")
-                    results[f"{name}_{address}"] = False
-                    continue
-                
-                # 下载合约
-                success = self.download_contract(chain_id, address, block_number, show_header=False, custom_name=name)
-                results[f"{name}_{address}"] = success
-                
+        if total_contracts == "?":
+            print("准备下载合约 (流式读取输入)...\n")
+        else:
+            print(f"准备下载 {total_contracts} 个合约...\n")
+        if concurrency > 1:
+            print(f"并发下载模式: {concurrency} 个工作线程")
+        if self.parse_workers > 0:
+            print(f"流水线模式: {self.persist_workers} 个写入线程，超过 {self.parse_process_threshold / 1024:g} KB 的源代码由 {self.parse_workers} 个解析进程处理")
+        
+        def emit(index: int, outcome: Tuple[str, bool]):
+            nonlocal next_index, successful_downloads, processed_contracts
+            pending_outcomes[index] = outcome
+            while next_index in pending_outcomes:
+                contract_id, success = pending_outcomes.pop(next_index)
+                results[contract_id] = success
+                processed_contracts += 1
                 if success:
                     successful_downloads += 1
-                
-                # 添加延迟避免API限制
-                if i < total_contracts:
-                    time.sleep(self.download_delay)
+                next_index += 1
+        
+        # 代理实现追踪: 每条链上的每个实现合约只下载一次，保存后链接到所有指向它的代理合约
+        implementation_results: Dict[str, bool] = {}
+        implementations: Dict[Tuple[str, str], Dict] = {}
+        implementation_queue = deque()
+        
+        def follow_implementation(index, contract: Dict, contract_data: Dict):
+            implementation = str(contract_data.get("Implementation", "")).strip()
+            if str(contract_data.get("Proxy", "")) != "1" or not self.is_valid_address(implementation):
+                return
+            depth = contract.get('_depth', 0) + 1
+            if depth > proxy_depth:
+                return
+            
+            chain = str(contract.get('chain', ''))
+            chain_id = self.chain_name_to_id.get(chain.lower(), chain)
+            proxy_name = contract.get('name', f'Contract_{index}')
+            key = (chain_id, implementation.lower())
+            
+            entry = implementations.get(key)
+            if entry is None:
+                entry = {
+                    "name": self.contract_dir_name(chain_id, implementation),
+                    "chain": chain_id,
+                    "address": implementation,
+                    "_depth": depth,
+                    "_proxy_of": [proxy_name],
+                    "_done": False
+                }
+                implementations[key] = entry
+                implementation_queue.append((("impl", len(implementations)), entry))
+            elif entry["_done"]:
+                self.backend.link_implementation(proxy_name, entry["name"])
+            else:
+                entry["_proxy_of"].append(proxy_name)
+        
+        def finish(index, contract: Dict, outcome: Tuple[str, bool, Optional[Dict]]):
+            contract_id, success, contract_data = outcome
+            if isinstance(index, int):
+                emit(index, (contract_id, success))
+            else:
+                implementation_results[contract_id] = success
+            journal.record(BatchJournal.entry_id(contract, index), contract_id, success)
+            self.metrics.inc("contracts_total", result="success" if success else "failure")
+            
+            if contract.get('_proxy_of'):
+                contract['_done'] = success
+                if success:
+                    for proxy_name in contract['_proxy_of']:
+                        self.backend.link_implementation(proxy_name, contract['name'])
+            if success and follow_proxies:
+                follow_implementation(index, contract, contract_data)
+        
+        def pending_contracts():
+            skipped = 0
+            sync_counts: Dict[str, int] = {}
+            for index, contract in enumerate(contracts, 1):
+                if resume and journal.is_done(BatchJournal.entry_id(contract, index)):
+                    name = contract.get('name', f'Contract_{index}')
+                    emit(index, (f"{name}_{contract.get('address', '')}", True))
+                    skipped += 1
+                    continue
+                if sync:
+                    task = self._batch_task(index, contract)
+                    status = self.sync_status(task, max_age)
+                    sync_counts[status] = sync_counts.get(status, 0) + 1
+                    self.metrics.inc("sync_checked_total", status=status)
+                    if status == "fresh":
+                        print(f"[{index}/{total_contracts}] {task['name']}: 已是最新，跳过")
+                        emit(index, (task["key"], True))
+                        continue
+                yield index, contract
+            if skipped:
+                print(f"\n断点续传: 跳过 {skipped} 个已成功下载的合约")
+            if sync:
+                labels = {"missing": "缺失", "changed": "地址或区块不同", "incomplete": "不完整", "stale": "过期"}
+                needed = ", ".join(f"{label} {sync_counts[status]}" for status, label in labels.items() if sync_counts.get(status))
+                print(f"\n同步模式: 跳过 {sync_counts.get('fresh', 0)} 个已是最新的合约" + (f"，需要下载: {needed}" if needed else ""))
+        
+        contract_source = pending_contracts()
+        source_exhausted = False
+        # 多链公平调度: 按链分队列并按优先级、在途请求数轮询，避免一条慢链或受限速的链拖住其他链
+        scheduler = None
+        if self.scheduler_policy != "fifo":
+            scheduler = FairScheduler(contract_source, self.batch_chain_key, self.scheduler_lookahead,
+                                      self.scheduler_policy, self.chain_weights)
+        # 被速率限制的合约重新排队，优先于新合约处理；
+        # 链熔断的合约延后到熔断恢复时再排队，其他链的合约继续下载
+        requeued = deque()
+        deferred: List[Tuple[float, int, object, Dict]] = []
+        deferred_sequence = 0
+        rate_limit_attempts: Dict = {}
+        circuit_deferrals: Dict = {}
+        
+        # 流水线: 获取 (线程池) -> 解析 (大体积源代码使用进程池) -> 写入 (线程池)。
+        # 已获取但尚未写入的合约不超过 queue_size 个、源代码总量不超过 pipeline_max_bytes，
+        # 写入跟不上时暂停获取，限制内存占用
+        queue_size = self.pipeline_queue_size if self.pipeline_queue_size > 0 else 2 * concurrency
+        in_flight = {}
+        staged = {}
+        parse_pool = None
+        persist_executor = ThreadPoolExecutor(max_workers=self.persist_workers, initializer=self._thread_initializer)
+        
+        # 合并重复条目: 相同 (链, 地址) 只请求一次，其余条目等待该请求完成后
+        # 共享请求结果 (和进程池的解析结果)，分别写入各自的输出目录
+        lookups: Dict[Tuple[str, str], Dict] = {}
+        
+        def submit_persist(index, contract: Dict, task: Dict, parsed=None):
+            future = persist_executor.submit(self._persist_batch_entry, task, parsed)
+            staged[future] = ("persist", index, contract, task, [])
+        
+        def submit_stages(index, contract: Dict, task: Dict, followers: List):
+            nonlocal parse_pool
+            contract_data = task["contract_data"]
+            if contract_data is None:
+                finish(index, contract, (task["key"], False, None))
+                for follower_index, follower, follower_task in followers:
+                    finish(follower_index, follower, (follower_task["key"], False, None))
+                return
+            
+            source_size = len(contract_data.get("SourceCode", ""))
+            if self.parse_workers > 0 and self.parse_process_threshold <= source_size < self.stream_parse_threshold:
+                if parse_pool is None:
+                    parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=multiprocessing.get_context("spawn"))
+                future = parse_pool.submit(timed_parse_source_code, contract_data["SourceCode"], contract_data.get("ContractName", "Unknown"))
+                staged[future] = ("parse", index, contract, task, followers)
+            else:
+                submit_persist(index, contract, task)
+                for follower_index, follower, follower_task in followers:
+                    submit_persist(follower_index, follower, follower_task)
+        
+        def staged_bytes() -> int:
+            # 共享请求结果的条目只计一次
+            sizes = {}
+            for _, _, _, task, _ in staged.values():
+                contract_data = task["contract_data"] or {}
+                sizes[id(contract_data)] = len(contract_data.get("SourceCode", ""))
+            return sum(sizes.values())
+        
+        def take_followers(index, contract: Dict, contract_data: Optional[Dict]) -> List:
+            entry = lookups.pop(self.batch_lookup_key(contract), None)
+            if entry is None or entry["leader"] != index:
+                return []
+            followers = []
+            for follower_index, follower in entry["followers"]:
+                follower_task = self._batch_task(follower_index, follower)
+                follower_task["contract_data"] = contract_data
+                followers.append((follower_index, follower, follower_task))
+            return followers
+        
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency, initializer=self._thread_initializer) as executor:
+                while True:
+                    # 熔断恢复时间已到的合约重新排队
+                    now = time.monotonic()
+                    while deferred and deferred[0][0] <= now:
+                        _, _, index, contract = heapq.heappop(deferred)
+                        requeued.append((index, contract))
                     
-            except Exception as e:
-                print(f"❌ 处理合约时出错: {e}")
-                results[f"Contract_{i}_{contract.get('address', 'unknown')}"] = False
+                    # 保持 concurrency 个请求同时进行，请求速率由令牌桶限速器控制
+                    while len(in_flight) < concurrency and len(staged) < queue_size and staged_bytes() < self.pipeline_max_bytes:
+                        if requeued:
+                            index, contract = requeued.popleft()
+                        elif implementation_queue:
+                            index, contract = implementation_queue.popleft()
+                        else:
+                            if source_exhausted:
+                                next_contract = None
+                            elif scheduler is not None:
+                                next_contract = scheduler.next(self.chain_available)
+                            else:
+                                next_contract = next(contract_source, None)
+                            if next_contract is None:
+                                source_exhausted = True
+                                break
+                            index, contract = next_contract
+                        
+                        lookup_key = self.batch_lookup_key(contract)
+                        if lookup_key is not None:
+                            entry = lookups.get(lookup_key)
+                            if entry is None:
+                                lookups[lookup_key] = {"leader": index, "followers": []}
+                            elif entry["leader"] != index:
+                                entry["followers"].append((index, contract))
+                                self.metrics.inc("coalesced_requests_total", scope="batch")
+                                name = contract.get('name', f'Contract_{index}')
+                                print(f"\n[{index}/{total_contracts}] {name}: 与正在下载的条目是同一合约 ({lookup_key[0]}, {contract.get('address')})，共享请求结果")
+                                continue
+                        future = executor.submit(self._fetch_batch_entry, index, total_contracts, contract)
+                        in_flight[future] = (index, contract)
+                        if scheduler is not None:
+                            scheduler.started(contract)
+                    
+                    if not in_flight and not staged:
+                        if not deferred:
+                            break
+                        time.sleep(max(0.0, deferred[0][0] - time.monotonic()))
+                        continue
+                    
+                    timeout = max(0.0, deferred[0][0] - time.monotonic()) if deferred else None
+                    done, _ = wait(list(in_flight) + list(staged), timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future in staged:
+                            stage, index, contract, task, followers = staged.pop(future)
+                            if stage == "persist":
+                                finish(index, contract, future.result())
+                                continue
+                            try:
+                                parsed, parse_seconds = future.result()
+                                self.metrics.observe("parse_seconds", parse_seconds, worker="process")
+                            except Exception as e:
+                                # 进程池不可用时退回写入线程中解析
+                                print(f"⚠️  解析进程出错，改为在写入线程中解析: {e}")
+                                parsed = None
+                            submit_persist(index, contract, task, parsed)
+                            for follower_index, follower, follower_task in followers:
+                                submit_persist(follower_index, follower, follower_task, parsed)
+                            continue
+                        
+                        index, contract = in_flight.pop(future)
+                        if scheduler is not None:
+                            scheduler.finished(contract)
+                        name = contract.get('name', f'Contract_{index}')
+                        try:
+                            task = future.result()
+                            submit_stages(index, contract, task, take_followers(index, contract, task["contract_data"]))
+                        except RateLimitError as e:
+                            attempts = rate_limit_attempts.get(index, 0) + 1
+                            rate_limit_attempts[index] = attempts
+                            if attempts > self.rate_limit_retries:
+                                print(f"❌ 多次触发API速率限制，放弃: {e}")
+                                submit_stages(index, contract, self._batch_task(index, contract), take_followers(index, contract, None))
+                            else:
+                                self.metrics.inc("requeued_total", reason="rate_limit")
+                                print(f"⏳ 触发API速率限制，已重新加入队列 ({attempts}/{self.rate_limit_retries})")
+                                requeued.append((index, contract))
+                        except RetryLaterError as e:
+                            deferrals = circuit_deferrals.get(index, 0) + 1
+                            circuit_deferrals[index] = deferrals
+                            if deferrals > self.circuit_max_deferrals:
+                                print(f"❌ {name}: {e}，多次延后仍无法请求，放弃")
+                                submit_stages(index, contract, self._batch_task(index, contract), take_followers(index, contract, None))
+                            else:
+                                self.metrics.inc("requeued_total", reason="circuit_open")
+                                print(f"⏸️  {name}: {e}，延后重试 ({deferrals}/{self.circuit_max_deferrals})")
+                                deferred_sequence += 1
+                                heapq.heappush(deferred, (time.monotonic() + e.retry_after, deferred_sequence, index, contract))
+        finally:
+            persist_executor.shutdown()
+            if parse_pool is not None:
+                parse_pool.shutdown()
+            journal.close()
+            self.backend.end_batch()
+            if self.metadata_index is not None:
+                self.metadata_index.end_batch()
+        
+        # 实现合约的结果附加在输入合约之后
+        if implementation_results:
+            results.update(implementation_results)
         
         # 显示总结
         print("\n" + "=" * 60)
         print("批量下载完成!")
-        print(f"成功: {successful_downloads}/{total_contracts}")
+        print(f"成功: {successful_downloads}/{processed_contracts}")
+        if implementation_results:
+            implementation_successes = sum(1 for success in implementation_results.values() if success)
+            print(f"代理实现合约: {implementation_successes}/{len(implementation_results)} (去重后)")
+        stats = self.http.connection_stats()
+        if stats["reused_connections"] is not None:
+            print(f"连接复用: {stats['reused_connections']}/{stats['requests']} 个请求复用了已有连接 (新建 {stats['new_connections']} 个)")
+        else:
+            print(f"HTTP/2 多路复用: 共 {stats['requests']} 个请求")
+        if self.cache is not None:
+            print(f"缓存命中: {self.cache.hits} 次 (未命中 {self.cache.misses} 次)")
+            if self.cache.negative_hits:
+                print(f"已知无源代码 (负缓存): 跳过 {self.cache.negative_hits} 个地址")
+        timings = []
+        for label, metric in (("请求", "api_request_seconds"), ("解析", "parse_seconds"), ("写入", "write_seconds")):
+            summary = self.metrics.histogram_summary(metric)
+            if summary:
+                timings.append(f"{label} {summary['p50'] * 1000:.0f}/{summary['p99'] * 1000:.0f} ms")
+        if timings:
+            print(f"耗时 p50/p99: {', '.join(timings)}")
+        rate_limit_wait = self.metrics.histogram_summary("rate_limit_wait_seconds")
+        if rate_limit_wait:
+            print(f"限速等待: 共 {rate_limit_wait['sum']:.1f} 秒，重试: {self.metrics.counter_total('retries_total'):.0f} 次")
+        if self.source_store is not None:
+            store = self.source_store
+            print(f"源文件去重: {store.files_linked} 个文件共 {store.blobs_written} 份新内容，节省 {store.bytes_saved / 1024:.1f} KB")
         print("=" * 60)
         
         # 显示详细结果
@@ -449,27 +3356,647 @@ class ContractDownloader:
             print(f"  {contract_id}: {status}")
         
         return results
+    
+    def plan_batch(self, contracts: Iterable[Dict], concurrency: Optional[int] = None, resume: bool = False, sync: bool = False, max_age: Optional[float] = None) -> Dict:
+        """批量下载的试运行计划 (不发送任何网络请求)
+        
+        按批量下载相同的规则解析链别名、校验地址、合并重复条目，检查检查点日志、已有输出 (sync) 和响应缓存，
+        统计每条链需要的 API 请求数，并按限速配置和密钥数量估算耗时。
+        
+        Returns:
+            Dict: 计划汇总 (总数、各类跳过数量、各链和各密钥池的请求数、预计耗时秒数)
+        """
+        concurrency = max(1, concurrency or self.concurrency)
+        max_age = float(os.getenv("SYNC_MAX_AGE", "0")) if max_age is None else max_age
+        request_seconds = float(os.getenv("PLAN_REQUEST_SECONDS", "0.5"))
+        completed = BatchJournal.load_completed(self.output_dir / self.journal_name) if resume else {}
+        
+        counts = {key: 0 for key in ("entries", "resumed", "invalid_chain", "invalid_address", "fresh", "duplicates", "cached", "negative", "api_calls")}
+        chains: Dict[str, Dict] = {}
+        seen = set()
+        
+        for index, contract in enumerate(contracts, 1):
+            counts["entries"] += 1
+            if completed.get(BatchJournal.entry_id(contract, index)):
+                counts["resumed"] += 1
+                continue
+            
+            task = self._batch_task(index, contract)
+            chain_id = task["chain_id"]
+            if chain_id not in self.chain_configs:
+                counts["invalid_chain"] += 1
+                continue
+            if not self.is_valid_address(task["address"]):
+                counts["invalid_address"] += 1
+                continue
+            
+            chain = chains.setdefault(chain_id, {"name": self.chain_configs[chain_id]["name"], "entries": 0, "api_calls": 0, "skipped": 0})
+            chain["entries"] += 1
+            if sync and self.sync_status(task, max_age) == "fresh":
+                counts["fresh"] += 1
+                chain["skipped"] += 1
+                continue
+            
+            lookup_key = (chain_id, task["address"].lower())
+            if lookup_key in seen:
+                counts["duplicates"] += 1
+                chain["skipped"] += 1
+                continue
+            seen.add(lookup_key)
+            
+            state = self.cache.peek(chain_id, task["address"], task["block_number"]) if self.cache is not None else None
+            if state == "negative" and self.recheck_missing:
+                state = None
+            if state is not None:
+                counts["cached" if state == "hit" else "negative"] += 1
+                chain["skipped"] += 1
+                continue
+            
+            counts["api_calls"] += 1
+            chain["api_calls"] += 1
+        
+        # 同一密钥环境变量的链共享一个密钥池和限速
+        pools: Dict[str, Dict] = {}
+        for chain_id, chain in chains.items():
+            env_var = self.api_key_env if self.use_v2_api else self.chain_configs[chain_id]["api_key_env"]
+            pool = pools.get(env_var)
+            if pool is None:
+                keys = max(1, len(self.get_api_keys(chain_id)))
+                rate = self.rate_limit * keys if self.rate_limit > 0 else 0
+                pool = pools[env_var] = {"keys": keys, "rate": rate, "api_calls": 0, "seconds": 0.0}
+            pool["api_calls"] += chain["api_calls"]
+        for pool in pools.values():
+            pool["seconds"] = pool["api_calls"] / pool["rate"] if pool["rate"] > 0 else 0.0
+        
+        rate_seconds = max((pool["seconds"] for pool in pools.values()), default=0.0)
+        latency_seconds = counts["api_calls"] * request_seconds / concurrency
+        return {
+            **counts,
+            "chains": chains,
+            "pools": pools,
+            "concurrency": concurrency,
+            "request_seconds": request_seconds,
+            "eta_seconds": max(rate_seconds, latency_seconds),
+            "eta_bound": "rate_limit" if rate_seconds >= latency_seconds else "latency"
+        }
+    
+    def run_queue_worker(self, queue, worker_id: Optional[str] = None, claim_size: Optional[int] = None, lease_seconds: Optional[float] = None, **batch_options) -> Dict[str, int]:
+        """分布式工作进程: 反复从工作队列领取一批条目并批量下载，直到队列中没有待处理的条目
+        
+        处理期间由心跳线程续约；进程退出或失联后租约过期，条目由其他工作进程重新领取。
+        batch_options 传给 download_contracts_batch (concurrency、follow_proxies、sync 等)。
+        
+        Returns:
+            Dict: 本工作进程完成的条目数量 {"success": n, "failure": n}
+        """
+        worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        claim_size = claim_size or int(os.getenv("QUEUE_CLAIM_SIZE", "50"))
+        lease_seconds = lease_seconds or float(os.getenv("QUEUE_LEASE_SECONDS", "300"))
+        # 多个工作进程共享输出目录，检查点日志按工作进程分开
+        self.journal_name = f".batch_journal.{worker_id}.jsonl"
+        if self.metadata_index is not None:
+            # 共享的索引每个合约提交一次，不在整批下载期间持有写锁
+            self.metadata_index.batch_size = 1
+        counts = {"success": 0, "failure": 0}
+        
+        while True:
+            claimed = queue.claim(worker_id, claim_size, lease_seconds)
+            if not claimed:
+                if not queue.has_work():
+                    break
+                # 其余条目正由其他工作进程处理，等待完成或租约过期
+                time.sleep(min(5.0, lease_seconds / 4))
+                continue
+            
+            print(f"\n工作进程 {worker_id}: 领取 {len(claimed)} 个条目")
+            handles = [handle for handle, _ in claimed]
+            stop_heartbeat = threading.Event()
+            
+            def heartbeat():
+                while not stop_heartbeat.wait(lease_seconds / 3):
+                    queue.renew(worker_id, handles, lease_seconds)
+            
+            heartbeat_thread = threading.Thread(target=heartbeat, name="queue-heartbeat", daemon=True)
+            heartbeat_thread.start()
+            try:
+                results = self.download_contracts_batch([entry for _, entry in claimed], **batch_options)
+            finally:
+                stop_heartbeat.set()
+                heartbeat_thread.join()
+            
+            for handle, entry in claimed:
+                contract_id = f"{entry['name']}_{entry.get('address', '')}"
+                success = results.get(contract_id, False)
+                queue.complete(handle, worker_id, success, contract_id)
+                counts["success" if success else "failure"] += 1
+                self.metrics.inc("queue_items_total", result="success" if success else "failure")
+        
+        print(f"\n工作进程 {worker_id}: 队列已处理完，成功 {counts['success']} 个，失败 {counts['failure']} 个")
+        return counts
 
-def main():
-    """主函数"""
-    parser = argparse.ArgumentParser(description="智能合约源代码下载器")
-    parser.add_argument("contract_address", nargs="?", help="合约地址")
-    parser.add_argument("chain_id", nargs="?", help="链ID (1=Ethereum, 56=BSC, 137=Polygon, 等)")
-    parser.add_argument("--block", "-b", help="区块号 (可选)", default=None)
-    parser.add_argument("--list-chains", "-l", action="store_true", help="显示支持的链")
-    parser.add_argument("--batch", help="批量下载，指定包含合约信息的JSON或CSV文件路径")
+class ContractService:
+    """常驻服务: 复用一个 ContractDownloader (连接池保持预热)，为分析工具提供低延迟查询
     
-    args = parser.parse_args()
+    最近的查询结果保存在内存 LRU 中；并发的相同查询由 ContractDownloader 的 single_flight 合并为一次 API 请求，
+    相同合约的并发下载同样只执行一次。
+    """
     
-    downloader = ContractDownloader()
+    def __init__(self, downloader: ContractDownloader, cache_size: int = 1024, cache_ttl: float = 600):
+        self.downloader = downloader
+        self.cache = LRUCache(cache_size, cache_ttl)
+        self.downloads = SingleFlight()
+        self.started_at = time.time()
     
-    if args.list_chains:
-        print("支持的区块链网络:")
-        for chain_id, config in downloader.chain_configs.items():
-            print(f"  {chain_id}: {config['name']} ({config['explorer_url']})")
+    def resolve(self, params: Dict) -> Tuple[str, str, Optional[str]]:
+        """校验并解析请求参数 (链别名、地址、区块号)，参数无效时抛出 ValueError"""
+        chain = str(params.get("chain") or params.get("chain_id") or "")
+        chain_id = self.downloader.chain_name_to_id.get(chain.lower(), chain)
+        address = str(params.get("address") or "")
+        block_number = params.get("block") or params.get("height")
+        if chain_id not in self.downloader.chain_configs:
+            raise ValueError(f"不支持的链 '{chain}'")
+        if not self.downloader.is_valid_address(address):
+            raise ValueError(f"无效的合约地址 '{address}'")
+        return chain_id, address, str(block_number) if block_number else None
+    
+    def lookup(self, chain_id: str, address: str, block_number: Optional[str] = None) -> Tuple[Optional[Dict], bool]:
+        """获取合约数据，返回 (合约数据, 是否命中内存缓存)
+        
+        链熔断或触发速率限制时抛出 RetryLaterError，不在请求线程中等待。
+        """
+        key = (chain_id, address.lower(), block_number)
+        contract_data = self.cache.get(key)
+        self.downloader.metrics.inc("serve_cache_total", result="hit" if contract_data is not None else "miss")
+        if contract_data is not None:
+            return contract_data, True
+        contract_data = self.downloader.get_contract_source(chain_id, address, block_number, retry_rate_limit=False)
+        if contract_data is not None:
+            self.cache.put(key, contract_data)
+        return contract_data, False
+    
+    def download(self, chain_id: str, address: str, block_number: Optional[str] = None, name: Optional[str] = None) -> Tuple[Optional[str], bool]:
+        """下载并保存合约，返回 (保存位置, 是否命中内存缓存)，失败时位置为 None"""
+        contract_data, cached = self.lookup(chain_id, address, block_number)
+        if contract_data is None:
+            return None, cached
+        dir_name = self.downloader.contract_dir_name(chain_id, address, block_number, name)
+        
+        def save():
+            return self.downloader.save_contract_files(chain_id, address, contract_data, block_number, name)
+        
+        success, _ = self.downloads.do(dir_name, save)
+        return (self.downloader.backend.describe(dir_name) if success else None), cached
+    
+    def health(self) -> Dict:
+        return {
+            "status": "ok",
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "cache": self.cache.stats(),
+            "connections": self.downloader.http.connection_stats()
+        }
+    
+    def handle(self, path: str, params: Dict) -> Tuple[int, object]:
+        """处理一个请求，返回 (HTTP 状态码, JSON 响应或 Prometheus 文本)"""
+        if path == "/health":
+            return 200, self.health()
+        if path == "/metrics":
+            return 200, self.downloader.metrics.to_prometheus()
+        if path not in ("/source", "/download"):
+            return 404, {"error": f"未知路径 {path}，支持: /source, /download, /health, /metrics"}
+        
+        try:
+            chain_id, address, block_number = self.resolve(params)
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        
+        try:
+            if path == "/source":
+                contract_data, cached = self.lookup(chain_id, address, block_number)
+                if contract_data is None:
+                    return 404, {"error": "未找到已验证的合约源代码", "chain_id": chain_id, "address": address}
+                return 200, {"chain_id": chain_id, "address": address, "cached": cached, "contract": contract_data}
+            
+            location, cached = self.download(chain_id, address, block_number, params.get("name"))
+            if location is None:
+                return 404, {"success": False, "error": "下载失败或合约未验证", "chain_id": chain_id, "address": address}
+            return 200, {"success": True, "chain_id": chain_id, "address": address, "cached": cached, "location": location}
+        except RetryLaterError as e:
+            return 503, {"error": str(e), "retry_after": e.retry_after}
+
+
+class ContractServiceHandler(BaseHTTPRequestHandler):
+    """ContractService 的 HTTP 接口: GET/POST 参数可放在查询字符串或 JSON 请求体中"""
+    
+    protocol_version = "HTTP/1.1"  # 保持连接，客户端重复查询无需重新建连
+    disable_nagle_algorithm = True  # 响应头和响应体分开写入，避免 Nagle 与延迟确认叠加出 40ms 的等待
+    
+    def do_GET(self):
+        self._dispatch()
+    
+    def do_POST(self):
+        self._dispatch()
+    
+    def _dispatch(self):
+        started = time.perf_counter()
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except ValueError:
+                body = None
+            if not isinstance(body, dict):
+                self._respond(400, {"error": "请求体必须是 JSON 对象"})
+                return
+            params.update(body)
+        
+        service = self.server.service
+        try:
+            status, payload = service.handle(url.path, params)
+        except Exception as e:
+            status, payload = 500, {"error": str(e)}
+        self._respond(status, payload)
+        service.downloader.metrics.inc("serve_requests_total", endpoint=url.path, status=str(status))
+        service.downloader.metrics.observe("serve_request_seconds", time.perf_counter() - started, endpoint=url.path)
+    
+    def _respond(self, status: int, payload):
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 503 and isinstance(payload, dict):
+            self.send_header("Retry-After", str(max(1, int(payload.get("retry_after") or 1))))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_service_server(service: ContractService, host: str = "127.0.0.1", port: int = 8800, verbose: bool = False) -> ThreadingHTTPServer:
+    """创建 serve 模式的 HTTP 服务器 (调用 serve_forever() 开始服务)"""
+    server = ThreadingHTTPServer((host, port), ContractServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def normalize_csv_row(row: Dict[str, str]) -> Dict[str, str]:
+    """将 CSV 行的常见列名映射为批量下载字段"""
+    contract = {}
+    
+    # 处理常见的列名映射
+    for key, value in row.items():
+        if key is None or value is None:
+            continue
+        key_lower = key.lower().strip()
+        
+        if key_lower in ['name', 'contract_name', '名称']:
+            contract['name'] = value.strip()
+        elif key_lower in ['chain', 'network', '链', '网络']:
+            contract['chain'] = value.strip()
+        elif key_lower in ['address', 'contract_address', 'contract', '地址', '合约地址']:
+            contract['address'] = value.strip()
+        elif key_lower in ['height', 'block', 'block_number', '区块', '区块号']:
+            if value.strip():
+                contract['height'] = value.strip()
+        elif key_lower in ['date', '日期']:
+            contract['date'] = value.strip()
+        elif key_lower in ['priority', '优先级']:
+            if value.strip():
+                contract['priority'] = value.strip()
+    
+    return contract
+
+
+def iter_json_array(f, chunk_size: int = 65536) -> Iterator:
+    """增量解析 JSON 数组，逐个返回元素，内存占用与文件大小无关"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    started = False
+    expect_value = True
+    
+    while True:
+        # 跳过空白和分隔符
+        while pos < len(buffer) and buffer[pos] in " \t\r\n":
+            pos += 1
+        
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("JSON 数组不完整")
+            chunk = f.read(chunk_size)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            eof = not chunk
+            continue
+        
+        char = buffer[pos]
+        if not started:
+            if char != "[":
+                raise ValueError("JSON文件应包含合约信息数组")
+            started = True
+            pos += 1
+            continue
+        
+        if char == "]":
+            return
+        if char == "," and not expect_value:
+            expect_value = True
+            pos += 1
+            continue
+        
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+            # 元素恰好在缓冲区末尾结束时可能被截断 (如数字)，读更多数据后重试
+            if end == len(buffer) and not eof:
+                raise json.JSONDecodeError("需要更多数据", buffer, end)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = f.read(chunk_size)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            eof = not chunk
+            continue
+        
+        yield item
+        pos = end
+        expect_value = False
+
+
+def iter_batch_file(batch_file: Path) -> Iterator[Dict]:
+    """按扩展名流式读取批量下载文件 (.csv / .json / .jsonl / .ndjson)
+    
+    文件逐行/逐元素读取，第一条记录读出后即可开始下载。
+    """
+    file_ext = Path(batch_file).suffix.lower()
+    
+    if file_ext == '.json':
+        # JSON 数组，增量解析
+        with open(batch_file, 'r', encoding='utf-8') as f:
+            yield from iter_json_array(f)
+    
+    elif file_ext in ('.jsonl', '.ndjson'):
+        # 每行一个 JSON 对象
+        with open(batch_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"警告: 第 {line_number} 行不是有效的 JSON，已跳过 ({e})")
+    
+    elif file_ext == '.csv':
+        with open(batch_file, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                contract = normalize_csv_row(row)
+                if contract.get('address'):  # 只有地址不为空才添加
+                    yield contract
+    
+    else:
+        raise ValueError(f"不支持的文件格式 '{file_ext}'，支持的格式: .json, .jsonl, .ndjson, .csv")
+
+
+def open_backend(output_dir: Path, backend: Optional[str] = None, db_path: Optional[str] = None):
+    """按参数或 OUTPUT_BACKEND / OUTPUT_DB 环境变量打开已有输出，用于读取"""
+    backend = (backend or os.getenv("OUTPUT_BACKEND", "directory")).lower()
+    if backend == "sqlite":
+        return SQLiteBackend(Path(db_path or os.getenv("OUTPUT_DB") or output_dir / "contracts.sqlite"))
+    return DirectoryBackend(output_dir, write_workers=1)
+
+
+def query_main(argv: List[str]):
+    """query 子命令: 查询已下载合约的元数据索引"""
+    parser = argparse.ArgumentParser(prog="contract_downloader.py query", description="查询已下载合约的元数据索引")
+    parser.add_argument("--chain", help="链标识 (如 'bsc', 'eth' 或链ID)")
+    parser.add_argument("--compiler", help="编译器版本: 前缀 (如 0.8 匹配 0.8.x) 或完整版本 (如 0.8.19)")
+    parser.add_argument("--optimization", choices=["on", "off"], help="是否启用优化")
+    proxy_group = parser.add_mutually_exclusive_group()
+    proxy_group.add_argument("--proxy", dest="proxy", action="store_const", const=True, default=None, help="只显示代理合约")
+    proxy_group.add_argument("--no-proxy", dest="proxy", action="store_const", const=False, help="只显示非代理合约")
+    parser.add_argument("--license", help="许可证类型 (如 MIT)")
+    parser.add_argument("--name", help="合约名称或目录名包含的字符串")
+    parser.add_argument("--address", help="合约地址 (同时匹配实现合约地址)")
+    parser.add_argument("--limit", type=int, default=None, help="最多显示的结果数")
+    parser.add_argument("--count", action="store_true", help="只显示结果数量")
+    parser.add_argument("--json", action="store_true", help="以 JSON 格式输出")
+    parser.add_argument("--index", default=None, help="索引数据库路径 (默认: INDEX_DB 环境变量或 <输出目录>/index.sqlite)")
+    parser.add_argument("--reindex", action="store_true", help="从输出目录 (或 OUTPUT_BACKEND 指定的后端) 重建索引")
+    args = parser.parse_args(argv)
+    
+    output_dir = Path(os.getenv("OUTPUT_DIR", "contracts"))
+    index_path = Path(args.index or os.getenv("INDEX_DB") or output_dir / "index.sqlite")
+    if not index_path.exists() and not args.reindex:
+        print(f"错误: 索引文件 '{index_path}' 不存在，请先下载合约或使用 --reindex 重建")
+        sys.exit(1)
+    
+    index = MetadataIndex(index_path)
+    try:
+        if args.reindex:
+            backend = open_backend(output_dir)
+            count = index.rebuild(backend)
+            backend.close()
+            print(f"已重建索引: {count} 个合约")
+        
+        chain_id = CHAIN_NAME_TO_ID.get(args.chain.lower(), args.chain) if args.chain else None
+        
+        start = time.perf_counter()
+        rows = index.query(
+            chain_id=chain_id,
+            compiler=args.compiler,
+            optimization=None if args.optimization is None else args.optimization == "on",
+            proxy=args.proxy,
+            license_type=args.license,
+            name=args.name,
+            address=args.address,
+            limit=args.limit
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    finally:
+        index.close()
+    
+    if args.json:
+        print(json.dumps(rows, indent=2, ensure_ascii=False))
         return
     
-    if args.batch:
+    if not args.count:
+        for row in rows:
+            optimization = {1: "on", 0: "off"}.get(row["optimization"], "?")
+            proxy = f" proxy -> {row['implementation']}" if row["proxy"] else ""
+            print(f"{row['contract']}  {row['chain_name']}  {row['address']}  {row['compiler_version']}  "
+                  f"opt={optimization} runs={row['runs']}  {row['license']}{proxy}")
+    print(f"共 {len(rows)} 个合约 ({elapsed_ms:.1f} ms)")
+
+
+def read_main(argv: List[str]):
+    """read 子命令: 读取已下载合约的源文件 (自动解压)"""
+    parser = argparse.ArgumentParser(prog="contract_downloader.py read", description="读取已下载合约的源文件，压缩保存的文件自动解压")
+    parser.add_argument("contract", help="合约目录名 (可用 query 子命令查找)")
+    parser.add_argument("file", nargs="?", help="源文件路径，省略时列出合约的所有源文件")
+    parser.add_argument("--extract", default=None, help="把合约的源文件和元数据解压写入指定目录")
+    parser.add_argument("--backend", choices=["directory", "sqlite"], default=None, help="输出后端 (默认: OUTPUT_BACKEND 环境变量或 directory)")
+    parser.add_argument("--output-db", default=None, help="sqlite 后端的数据库文件 (默认: OUTPUT_DB 环境变量或 <输出目录>/contracts.sqlite)")
+    args = parser.parse_args(argv)
+    
+    backend = open_backend(Path(os.getenv("OUTPUT_DIR", "contracts")), args.backend, args.output_db)
+    try:
+        metadata = backend.read_metadata(args.contract)
+        if metadata is None:
+            print(f"错误: 合约 '{args.contract}' 不存在")
+            sys.exit(1)
+        
+        if args.file:
+            content = backend.read_file(args.contract, args.file)
+            if content is None:
+                print(f"错误: 合约 '{args.contract}' 中没有文件 '{args.file}'")
+                sys.exit(1)
+            sys.stdout.write(content)
+            return
+        
+        if not args.extract:
+            for path in backend.list_files(args.contract):
+                print(path)
+            return
+        
+        target_dir = Path(args.extract) / args.contract
+        files = backend.read_files(args.contract)
+        for path, content in files.items():
+            file_path = target_dir / path
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write(content)
+        with open(target_dir / "metadata.json", "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        print(f"已解压 {len(files)} 个文件到: {target_dir}")
+    finally:
+        backend.close()
+
+
+def format_duration(seconds: float) -> str:
+    """把秒数格式化为 1h 2m 3s 的形式"""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    parts = [f"{hours}h"] if hours else []
+    if hours or minutes:
+        parts.append(f"{minutes}m")
+    parts.append(f"{seconds}s")
+    return " ".join(parts)
+
+
+def print_batch_plan(plan: Dict, follow_proxies: bool = False):
+    """打印 plan_batch 的结果"""
+    print("=" * 60)
+    print("批量下载计划 (试运行，未发送网络请求)")
+    print("=" * 60)
+    invalid = plan["invalid_chain"] + plan["invalid_address"]
+    print(f"条目: {plan['entries']}，无效: {invalid} (不支持的链 {plan['invalid_chain']}，无效地址 {plan['invalid_address']})")
+    if plan["resumed"]:
+        print(f"断点续传跳过: {plan['resumed']}")
+    if plan["fresh"]:
+        print(f"同步模式跳过 (已是最新): {plan['fresh']}")
+    print(f"重复条目 (共享请求): {plan['duplicates']}，响应缓存命中: {plan['cached']}，负缓存 (已知无源代码): {plan['negative']}")
+    print(f"需要请求 API: {plan['api_calls']} 次")
+    
+    if plan["chains"]:
+        print(f"\n{'链':<23}{'条目':>6}{'API 请求':>8}{'跳过':>6}")
+        for chain_id, chain in sorted(plan["chains"].items(), key=lambda item: -item[1]["api_calls"]):
+            label = f"{chain['name']} ({chain_id})"
+            print(f"{label:<24}{chain['entries']:>8}{chain['api_calls']:>10}{chain['skipped']:>8}")
+    
+    print()
+    for env_var, pool in plan["pools"].items():
+        if pool["rate"] > 0:
+            print(f"限速: {env_var} {pool['keys']} 个密钥，共 {pool['rate']:g} 次/秒，{pool['api_calls']} 次请求约 {format_duration(pool['seconds'])}")
+        else:
+            print(f"限速: {env_var} {pool['keys']} 个密钥，不限速")
+    bound = "受限速约束" if plan["eta_bound"] == "rate_limit" else f"受并发约束，{plan['concurrency']} 个并发、单次请求按 {plan['request_seconds']:g} 秒估算"
+    print(f"预计耗时: {format_duration(plan['eta_seconds'])} ({bound})")
+    if follow_proxies:
+        print("注意: 已启用代理实现追踪，代理合约的实现合约需要额外的请求，未计入上述估算")
+    print("=" * 60)
+
+
+def print_queue_report(queue):
+    """打印工作队列汇总，全部完成且没有失败时返回 True"""
+    report = queue.report()
+    statuses = report["statuses"]
+    total = sum(statuses.values())
+    print(f"工作队列: 共 {total} 个条目，完成 {statuses.get('done', 0)}，失败 {statuses.get('failed', 0)}，"
+          f"处理中 {statuses.get('leased', 0)}，待处理 {statuses.get('pending', 0)}")
+    for worker, counts in sorted(report["workers"].items()):
+        print(f"  {worker}: 完成 {counts.get('done', 0)}，失败 {counts.get('failed', 0)}")
+    if report["failures"]:
+        print("失败的条目:")
+        for failure in report["failures"]:
+            entry = failure["entry"] or {}
+            reason = f" ({failure['error']})" if failure.get("error") else ""
+            print(f"  #{failure['id']} {entry.get('name', '')} {entry.get('chain', '')} {entry.get('address', '')}{reason}")
+    return statuses.get("done", 0) == total
+
+
+def serve_main(argv: List[str]):
+    """serve 子命令: 以常驻 HTTP 服务的方式提供合约查询和下载"""
+    parser = argparse.ArgumentParser(prog="contract_downloader.py serve", description="常驻 HTTP 服务: 复用连接池和内存缓存，低延迟查询和下载合约")
+    parser.add_argument("--host", default=os.getenv("SERVE_HOST", "127.0.0.1"), help="监听地址 (默认: SERVE_HOST 环境变量或 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVE_PORT", "8800")), help="监听端口 (默认: SERVE_PORT 环境变量或 8800)")
+    parser.add_argument("--cache-size", type=int, default=int(os.getenv("SERVE_CACHE_SIZE", "1024")), help="内存 LRU 缓存的合约数 (默认: SERVE_CACHE_SIZE 环境变量或 1024)")
+    parser.add_argument("--cache-ttl", type=float, default=float(os.getenv("SERVE_CACHE_TTL", "600")), help="内存缓存有效期秒数，0 为不过期 (默认: SERVE_CACHE_TTL 环境变量或 600)")
+    parser.add_argument("--verbose", action="store_true", help="输出每个 HTTP 请求的访问日志")
+    args = parser.parse_args(argv)
+    
+    downloader = ContractDownloader()
+    downloader.http.ensure_pool_size(max(downloader.concurrency, 16))
+    service = ContractService(downloader, cache_size=args.cache_size, cache_ttl=args.cache_ttl)
+    server = make_service_server(service, args.host, args.port, args.verbose)
+    print(f"合约服务已启动: http://{args.host}:{server.server_address[1]}")
+    print("  GET /source?chain=eth&address=0x...      获取合约源代码 (JSON)")
+    print("  GET /download?chain=eth&address=0x...    下载并保存合约")
+    print("  GET /health, GET /metrics                状态和 Prometheus 指标")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在停止服务...")
+    finally:
+        server.server_close()
+        downloader.close()
+
+
+def run_downloads(downloader: ContractDownloader, args, parser: argparse.ArgumentParser):
+    """执行批量或单个合约下载 (失败时以退出码 1 退出)"""
+    if args.queue_status:
+        queue = open_work_queue(args.queue_status)
+        try:
+            complete = print_queue_report(queue)
+        finally:
+            queue.close()
+        if not complete:
+            sys.exit(1)
+    elif args.work:
+        # 分布式工作进程模式
+        queue = open_work_queue(args.work)
+        try:
+            counts = downloader.run_queue_worker(
+                queue, args.worker_id, claim_size=args.claim_size, lease_seconds=args.lease,
+                concurrency=args.concurrency, follow_proxies=args.follow_proxies, proxy_depth=args.proxy_depth,
+                sync=args.sync, max_age=args.max_age
+            )
+            print_queue_report(queue)
+        finally:
+            queue.close()
+        if counts["failure"]:
+            sys.exit(1)
+    elif args.batch:
         # 批量下载模式
         try:
             batch_file = Path(args.batch)
@@ -478,57 +4005,37 @@ def main():
                 print(f"错误: 文件 '{args.batch}' 不存在")
                 sys.exit(1)
             
-            # 根据文件扩展名判断格式
+            # 根据文件扩展名判断格式，流式读取
             file_ext = batch_file.suffix.lower()
-            
-            if file_ext == '.json':
-                # JSON 文件
-                with open(batch_file, 'r', encoding='utf-8') as f:
-                    contracts = json.load(f)
-                
-                if not isinstance(contracts, list):
-                    print("错误: JSON文件应包含合约信息数组")
-                    sys.exit(1)
-                    
-            elif file_ext == '.csv':
-                # CSV 文件
-                contracts = []
-                
-                with open(batch_file, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        contract = {}
-                        
-                        # 处理常见的列名映射
-                        for key, value in row.items():
-                            key_lower = key.lower().strip()
-                            
-                            if key_lower in ['name', 'contract_name', '名称']:
-                                contract['name'] = value.strip()
-                            elif key_lower in ['chain', 'network', '链', '网络']:
-                                contract['chain'] = value.strip()
-                            elif key_lower in ['address', 'contract_address', 'contract', '地址', '合约地址']:
-                                contract['address'] = value.strip()
-                            elif key_lower in ['height', 'block', 'block_number', '区块', '区块号']:
-                                if value.strip():
-                                    contract['height'] = value.strip()
-                            elif key_lower in ['date', '日期']:
-                                contract['date'] = value.strip()
-                        
-                        if contract.get('address'):  # 只有地址不为空才添加
-                            contracts.append(contract)
-                
-                if not contracts:
-                    print("错误: CSV文件中没有找到有效的合约信息")
-                    sys.exit(1)
-                    
-            else:
+            if file_ext not in ('.json', '.jsonl', '.ndjson', '.csv'):
                 print(f"错误: 不支持的文件格式 '{file_ext}'")
-                print("支持的格式: .json, .csv")
+                print("支持的格式: .json, .jsonl, .ndjson, .csv")
                 sys.exit(1)
             
+            contracts = iter_batch_file(batch_file)
+            
+            if args.plan:
+                plan = downloader.plan_batch(contracts, concurrency=args.concurrency, resume=args.resume, sync=args.sync, max_age=args.max_age)
+                follow_proxies = downloader.follow_proxies if args.follow_proxies is None else args.follow_proxies
+                print_batch_plan(plan, follow_proxies)
+                return
+            
+            if args.enqueue:
+                # 协调者模式: 只把条目写入工作队列，由工作进程 (--work) 下载
+                queue = open_work_queue(args.enqueue)
+                try:
+                    count = queue.enqueue(contracts)
+                finally:
+                    queue.close()
+                print(f"已写入工作队列 {args.enqueue}: {count} 个条目")
+                return
+            
             # 执行批量下载
-            results = downloader.download_contracts_batch(contracts)
+            results = downloader.download_contracts_batch(contracts, concurrency=args.concurrency, resume=args.resume, follow_proxies=args.follow_proxies, proxy_depth=args.proxy_depth, sync=args.sync, max_age=args.max_age)
+            
+            if not results:
+                print("错误: 文件中没有找到有效的合约信息")
+                sys.exit(1)
             
             # 检查是否有失败的下载
             failed_count = sum(1 for success in results.values() if not success)
@@ -551,5 +4058,92 @@ def main():
         if not success:
             sys.exit(1)
 
+def main():
+    """主函数"""
+    if sys.argv[1:2] == ["query"]:
+        query_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["read"]:
+        read_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["serve"]:
+        serve_main(sys.argv[2:])
+        return
+    
+    parser = argparse.ArgumentParser(description="智能合约源代码下载器")
+    parser.add_argument("contract_address", nargs="?", help="合约地址")
+    parser.add_argument("chain_id", nargs="?", help="链ID (1=Ethereum, 56=BSC, 137=Polygon, 等)")
+    parser.add_argument("--block", "-b", help="区块号 (可选)", default=None)
+    parser.add_argument("--list-chains", "-l", action="store_true", help="显示支持的链")
+    parser.add_argument("--batch", help="批量下载，指定包含合约信息的 JSON/JSONL/NDJSON 或 CSV 文件路径")
+    parser.add_argument("--concurrency", "-c", type=int, default=None, help="批量下载的并发数 (默认: CONCURRENCY 环境变量或 1)")
+    parser.add_argument("--resume", action="store_true", help="从检查点日志恢复中断的批量下载，跳过已成功的合约")
+    parser.add_argument("--plan", action="store_true", help="试运行: 统计 --batch 需要的 API 请求数和预计耗时，不发送网络请求")
+    parser.add_argument("--sync", action="store_true", help="同步模式: 只下载输出中缺失、不完整或过期的合约，跳过已是最新的合约")
+    parser.add_argument("--max-age", type=float, default=None, help="同步模式下已有输出的有效期秒数 (默认: SYNC_MAX_AGE 环境变量或 0，即永不过期)")
+    parser.add_argument("--enqueue", metavar="QUEUE", default=None, help="协调者模式: 把 --batch 的条目写入工作队列 (.sqlite/.db 文件或共享存储上的目录)")
+    parser.add_argument("--work", metavar="QUEUE", default=None, help="工作进程模式: 从工作队列领取条目下载，直到队列处理完")
+    parser.add_argument("--queue-status", metavar="QUEUE", default=None, help="显示工作队列的汇总和失败条目")
+    parser.add_argument("--worker-id", default=None, help="工作进程标识 (默认: 主机名-进程号)")
+    parser.add_argument("--claim-size", type=int, default=None, help="工作进程每次领取的条目数 (默认: QUEUE_CLAIM_SIZE 环境变量或 50)")
+    parser.add_argument("--lease", type=float, default=None, help="领取条目的租约秒数，过期后可被其他工作进程领取 (默认: QUEUE_LEASE_SECONDS 环境变量或 300)")
+    parser.add_argument("--scheduler", choices=list(FairScheduler.POLICIES), default=None, help="批量下载的多链调度策略 (默认: SCHEDULER 环境变量或 round-robin)")
+    parser.add_argument("--chain-weights", default=None, help="weighted 调度的链权重，如 'bsc=1,eth=3' (默认: CHAIN_WEIGHTS 环境变量)")
+    parser.add_argument("--follow-proxies", action="store_true", default=None, help="自动下载代理合约的实现合约 (每条链上的实现合约只下载一次)")
+    parser.add_argument("--proxy-depth", type=int, default=None, help="追踪代理实现的最大层数 (默认: PROXY_MAX_DEPTH 环境变量或 3)")
+    parser.add_argument("--dedup", action="store_true", help="启用内容寻址的源文件存储，相同源文件只保存一份 (硬链接)")
+    parser.add_argument("--backend", choices=["directory", "sqlite"], default=None, help="输出后端 (默认: OUTPUT_BACKEND 环境变量或 directory)")
+    parser.add_argument("--output-db", default=None, help="sqlite 后端的数据库文件 (默认: OUTPUT_DB 环境变量或 <输出目录>/contracts.sqlite)")
+    parser.add_argument("--fsync", choices=["none", "contract", "batch"], default=None, help="写入同步策略 (默认: FSYNC_POLICY 环境变量；目录后端为 none，sqlite 后端为 batch)")
+    parser.add_argument("--compress", choices=["none", "gzip", "zstd"], default=None, help="压缩保存源文件 (默认: COMPRESSION 环境变量或 none；zstd 需要安装 zstandard)")
+    parser.add_argument("--compress-mode", choices=["file", "bundle"], default=None, help="目录后端的压缩方式: 逐个文件或每个合约一个压缩包 (默认: COMPRESSION_MODE 环境变量或 file)")
+    parser.add_argument("--rate-limit", type=float, default=None, help="每秒最大 API 请求数 (默认: RATE_LIMIT 环境变量，0 表示不限速)")
+    parser.add_argument("--burst", type=int, default=None, help="令牌桶突发容量 (默认: RATE_LIMIT_BURST 环境变量)")
+    parser.add_argument("--cache-dir", default=None, help="响应缓存目录 (默认: CACHE_DIR 环境变量或 .contract_cache)")
+    parser.add_argument("--no-cache", action="store_true", help="禁用响应缓存")
+    parser.add_argument("--recheck-missing", action="store_true", help="忽略负缓存，重新请求已知未验证或源代码为空的地址")
+    parser.add_argument("--metrics-json", default=None, help="运行结束时写入 JSON 指标报告 (默认: METRICS_JSON 环境变量)")
+    parser.add_argument("--metrics-prom", default=None, help="定期写入 Prometheus 文本格式指标文件 (默认: METRICS_PROM_FILE 环境变量)")
+    parser.add_argument("--metrics-interval", type=float, default=None, help="Prometheus 指标文件的更新间隔秒数 (默认: METRICS_INTERVAL 环境变量或 15)")
+    parser.add_argument("--profile", default=None, help="使用 cProfile 剖析本次运行并保存到指定文件")
+    
+    args = parser.parse_args()
+    
+    downloader = ContractDownloader(cache_enabled=False if args.no_cache else None, cache_dir=args.cache_dir)
+    if args.rate_limit is not None or args.burst is not None:
+        downloader.configure_rate_limit(args.rate_limit, args.burst)
+    if args.fsync:
+        downloader.fsync_policy = args.fsync
+    if args.compress:
+        downloader.compression = resolve_compression(args.compress)
+    if args.compress_mode:
+        downloader.compression_mode = args.compress_mode
+    if args.backend or args.output_db or args.fsync or args.compress or args.compress_mode:
+        downloader.configure_backend(args.backend or downloader.backend.name, args.output_db or os.getenv("OUTPUT_DB"))
+    if args.dedup and downloader.source_store is None:
+        downloader.configure_source_store()
+    if args.scheduler or args.chain_weights:
+        downloader.configure_scheduler(args.scheduler, args.chain_weights)
+    if args.recheck_missing:
+        downloader.recheck_missing = True
+    if args.metrics_json or args.metrics_prom or args.metrics_interval is not None:
+        interval = args.metrics_interval if args.metrics_interval is not None else float(os.getenv("METRICS_INTERVAL", "15"))
+        downloader.configure_metrics(args.metrics_json, args.metrics_prom or downloader.metrics_prom, interval)
+    
+    if args.list_chains:
+        print("支持的区块链网络:")
+        for chain_id, config in downloader.chain_configs.items():
+            print(f"  {chain_id}: {config['name']} ({config['explorer_url']})")
+        return
+    
+    if args.profile:
+        downloader.start_profile()
+    try:
+        run_downloads(downloader, args, parser)
+    finally:
+        if args.profile:
+            downloader.stop_profile(args.profile)
+        downloader.close()
+
 if __name__ == "__main__":
     main()